@@ -0,0 +1,169 @@
+import uuid
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from ninja.security import HttpBearer
+from ..main.cache import TTLCache, MISSING
+from ..main.models import Project, SharedLink
+from .clients import get_client
+from .utils import APIError
+
+
+class AuthCache:
+    """
+    Caches the projects resolved from API tokens.
+
+    Lookups go through an in-process LRU first and then, if AUTH_CACHE_ALIAS is set, through the
+    shared Django cache so that the other workers benefit from it as well.
+    Shared link tokens are mapped to project UUIDs, so invalidating a project covers its links too.
+
+    Invalidations only reach the in-process entries of the worker that saved or deleted the object, so the
+    in-process entries are kept for `local_ttl` seconds only: a revoked project or shared link stays usable
+    in the other workers for up to `local_ttl` seconds.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60, local_ttl=5, alias=None):
+        self.local = TTLCache(maxsize=maxsize, ttl=min(local_ttl, ttl))
+        self.ttl = ttl
+        self.alias = alias
+        self.shared_hits = 0
+        self.shared_misses = 0
+
+    @property
+    def shared(self):
+        return caches[self.alias] if self.alias else None
+
+    async def aget(self, key):
+        value = self.local.get(key, MISSING)
+        if value is not MISSING or self.shared is None:
+            return value
+
+        value = await self.shared.aget(self._shared_key(key), MISSING)
+        if value is MISSING:
+            self.shared_misses += 1
+        else:
+            self.shared_hits += 1
+            self.local.set(key, value)
+        return value
+
+    async def aset(self, key, value):
+        self.local.set(key, value)
+        if self.shared is not None:
+            await self.shared.aset(self._shared_key(key), value, self.ttl)
+
+    def invalidate(self, key):
+        self.local.delete(key)
+        if self.shared is not None:
+            self.shared.delete(self._shared_key(key))
+
+    def clear(self):
+        self.local.clear()
+
+    def stats(self):
+        return {
+            **self.local.stats(),
+            'shared_hits': self.shared_hits,
+            'shared_misses': self.shared_misses,
+        }
+
+    @staticmethod
+    def _shared_key(key):
+        return f"oa:auth:{key}"
+
+
+auth_cache = AuthCache(
+    maxsize=settings.AUTH_CACHE_SIZE,
+    ttl=settings.AUTH_CACHE_TTL,
+    local_ttl=settings.AUTH_CACHE_LOCAL_TTL,
+    alias=settings.AUTH_CACHE_ALIAS,
+)
+
+
+def _normalize(token):
+    # Tokens are UUIDs that may come in different spellings; keep a single cache entry per object
+    try:
+        return str(uuid.UUID(str(token)))
+    except ValueError:
+        return str(token)
+
+
+def project_cache_key(project_uuid):
+    return f"project:{_normalize(project_uuid)}"
+
+
+def shared_link_cache_key(token):
+    return f"shared_link:{_normalize(token)}"
+
+
+async def aget_project(token):
+    """Returns the project with the given UUID token; raises Project.DoesNotExist if there is none."""
+    key = project_cache_key(token)
+    project = await auth_cache.aget(key)
+    if project is MISSING:
+        project = await Project.objects.aget(uuid=token)
+        await auth_cache.aset(key, project)
+    return project
+
+
+async def aget_shared_link_project(token):
+    """Returns the project of the shared link; raises SharedLink.DoesNotExist if the token is invalid."""
+    key = shared_link_cache_key(token)
+    project_uuid = await auth_cache.aget(key)
+    if project_uuid is MISSING:
+        shared_link = await SharedLink.objects.select_related('project').aget(token=token)
+        await auth_cache.aset(key, shared_link.project.uuid)
+        await auth_cache.aset(project_cache_key(shared_link.project.uuid), shared_link.project)
+        return shared_link.project
+
+    try:
+        return await aget_project(project_uuid)
+    except Project.DoesNotExist:
+        auth_cache.invalidate(key)
+        raise SharedLink.DoesNotExist
+
+
+class BearerAuth(HttpBearer):
+    """
+    Authenticates the requests with the project UUID sent as the Bearer token.
+
+    The resolved project and client are memoized on the request, so the token is only resolved once per request
+    and, through the auth cache, once per page load across the APIs.
+    """
+    allow_shared = False
+
+    async def authenticate(self, request, token: str):
+        memo = getattr(request, '_oa_auth', None)
+        if memo and memo[0] == token:
+            return memo[1]
+
+        if token:
+            try:
+                project = await aget_project(token)
+            except (Project.DoesNotExist, ValidationError, ValueError):
+                # Malformed tokens are rejected by the UUID field
+                return None
+        elif self.allow_shared:
+            # User is anonymous, check for shared token
+            shared_token = request.headers.get('X-Token') or request.GET.get('token')
+            if not shared_token:
+                raise APIError("Authentication required.", status=401)
+            try:
+                project = await aget_shared_link_project(shared_token)
+            except (SharedLink.DoesNotExist, ValidationError, ValueError):
+                raise APIError("Invalid or missing shared token.", status=403)
+        else:
+            return None
+
+        auth = {
+            'project': project,
+            'client': get_client(project),
+        }
+        request._oa_auth = (token, auth)
+        return auth
+
+
+class SharedBearerAuth(BearerAuth):
+    """
+    Also lets anonymous users in with a shared link token sent in the X-Token header or the token query parameter.
+    """
+    allow_shared = True
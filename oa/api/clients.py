@@ -0,0 +1,112 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+
+import httpx
+from django.conf import settings
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+
+class ClientRegistry:
+    """
+    Keeps a long-lived AsyncOpenAI client per project so that requests share a connection pool
+    instead of paying for a new TLS handshake on every call.
+
+    Clients that are evicted, replaced after a key change or reset are closed on their event loop
+    after `close_delay` seconds, which leaves the requests still using them the time to finish.
+    """
+
+    def __init__(self, max_clients=100, idle_timeout=600, close_delay=600):
+        self.max_clients = max_clients
+        self.idle_timeout = idle_timeout
+        self.close_delay = close_delay
+        self._clients = OrderedDict()  # project uuid -> (key, loop, client, last_used)
+        self._lock = threading.Lock()
+
+    def get(self, project):
+        """Returns the pooled client for the project, creating it if needed."""
+        loop = self._running_loop()
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._clients.pop(project.uuid, None)
+
+            # The key may have been changed or the client may belong to an event loop that is gone
+            if entry and entry[0] == project.key and entry[1] is loop:
+                client = entry[2]
+            else:
+                if entry:
+                    self._close(entry)
+                client = self._create_client(project.key)
+
+            self._clients[project.uuid] = (project.key, loop, client, now)
+            self._evict(now)
+
+        return client
+
+    def reset(self, project_uuid):
+        """Drops the client of the project, e.g. after its key has changed."""
+        with self._lock:
+            if entry := self._clients.pop(project_uuid, None):
+                self._close(entry)
+
+    def clear(self):
+        with self._lock:
+            for entry in self._clients.values():
+                self._close(entry)
+            self._clients.clear()
+
+    def __len__(self):
+        return len(self._clients)
+
+    def _evict(self, now):
+        # Entries are ordered by last use, so the idle ones are at the front
+        while self._clients:
+            _, (_, _, _, last_used) = next(iter(self._clients.items()))
+            if len(self._clients) > self.max_clients or now - last_used > self.idle_timeout:
+                _, entry = self._clients.popitem(last=False)
+                self._close(entry)
+            else:
+                break
+
+    def _close(self, entry):
+        _, loop, client, _ = entry
+        # Clients created outside of an event loop hold no connections yet
+        if loop is None or loop.is_closed():
+            return
+        try:
+            loop.call_soon_threadsafe(loop.call_later, self.close_delay, lambda: loop.create_task(client.close()))
+        except RuntimeError:
+            pass  # The loop was closed in the meantime
+
+    @staticmethod
+    def _running_loop():
+        # httpx connections are bound to the event loop they were opened in
+        try:
+            return asyncio.get_running_loop()
+        except RuntimeError:
+            return None
+
+    @staticmethod
+    def _create_client(api_key):
+        http_client = DefaultAsyncHttpxClient(
+            http2=settings.OPENAI_HTTP2,
+            limits=httpx.Limits(
+                max_connections=settings.OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.OPENAI_KEEPALIVE_EXPIRY,
+            ),
+        )
+        return AsyncOpenAI(api_key=api_key, http_client=http_client)
+
+
+client_registry = ClientRegistry(
+    max_clients=settings.OPENAI_MAX_CLIENTS,
+    idle_timeout=settings.OPENAI_CLIENT_IDLE_TIMEOUT,
+    close_delay=settings.OPENAI_CLIENT_CLOSE_DELAY,
+)
+
+
+def get_client(project):
+    return client_registry.get(project)
@@ -0,0 +1,296 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import storages
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+
+
+logger = logging.getLogger(__name__)
+
+
+class FileContentCache:
+    """
+    Cache of the OpenAI file contents, which never change once a file is created.
+
+    Contents are kept per project and file id, either in a local directory or in a Django storage
+    (e.g. the S3 backend of STORAGES["default"]). A metadata file with the content type is stored next to each entry.
+    The least recently used entries are removed when the cache grows over `max_bytes`; storages can't record
+    the access time, so the oldest entries are removed from them instead.
+    The size of the cache is listed once and then tracked as entries are stored, so that the entries are only
+    listed again when it goes over `max_bytes`; eviction then brings it down to `low_water` of `max_bytes`.
+    """
+
+    # Location of the entries in a storage
+    storage_prefix = 'file-cache'
+    low_water = 0.9
+
+    def __init__(self, directory=None, storage_alias=None, max_bytes=1024 ** 3):
+        self.directory = directory
+        self.storage_alias = storage_alias
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._size = None  # Total size of the entries, as far as this process knows
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    @property
+    def storage(self):
+        return storages[self.storage_alias] if self.storage_alias else None
+
+    def open(self, project_pk, file_id):
+        """Returns the cached file, opened for reading, and its metadata; or None if it isn't cached."""
+        if not self.enabled:
+            return None
+
+        try:
+            name = self._get_name(project_pk, file_id)
+            if self.storage:
+                with self.storage.open(f"{name}.json") as f:
+                    meta = json.load(f)
+                file = self.storage.open(name, 'rb')
+            else:
+                path = os.path.join(self.directory, name)
+                with open(f"{path}.json") as f:
+                    meta = json.load(f)
+                file = open(path, 'rb')
+                os.utime(path)  # Marks the entry as recently used
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return file, meta
+
+    async def aopen(self, project_pk, file_id):
+        return await asyncio.to_thread(self.open, project_pk, file_id)
+
+    async def tee(self, project_pk, file_id, chunks, content_type):
+        """
+        Relays the chunks of a file content stream while writing them to the cache.
+        The entry is stored only if the stream is read to the end.
+        """
+        directory = self.directory if not self.storage else None
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+
+        complete = False
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                async for chunk in chunks:
+                    f.write(chunk)
+                    yield chunk
+            complete = True
+        finally:
+            if complete:
+                await asyncio.to_thread(
+                    self._store, project_pk, file_id, temp_path, {'content_type': content_type}
+                )
+            else:
+                # The client disconnected or the upstream failed
+                await chunks.aclose()
+                os.remove(temp_path)
+
+    def _store(self, project_pk, file_id, temp_path, meta):
+        stored_size = 0
+        try:
+            name = self._get_name(project_pk, file_id)
+            size = os.path.getsize(temp_path)
+            if size > self.max_bytes:
+                return
+            if self.storage:
+                if not self.storage.exists(name):
+                    # The metadata is saved last, as it marks the entry as complete
+                    with open(temp_path, 'rb') as f:
+                        self.storage.save(name, File(f))
+                    self.storage.save(f"{name}.json", ContentFile(json.dumps(meta)))
+                    stored_size = size
+            else:
+                path = os.path.join(self.directory, name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(f"{path}.json", 'w') as f:
+                    json.dump(meta, f)
+                os.replace(temp_path, path)
+                stored_size = size
+        except (OSError, ValueError) as e:
+            logger.warning(f"Failed to cache the content of file {file_id}: {e}")
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        with self._lock:
+            if self._size is not None:
+                self._size += stored_size
+            if self._size is not None and self._size <= self.max_bytes:
+                return
+        self.evict()
+
+    def evict(self):
+        with self._lock:
+            entries = self._list_entries()
+            total = sum(size for _, size, _ in entries)
+            if total > self.max_bytes:
+                for _, size, name in sorted(entries):
+                    if total <= self.max_bytes * self.low_water:
+                        break
+                    self._remove(name)
+                    total -= size
+            self._size = total
+
+    def _list_entries(self):
+        """Returns (access or modification time, size, name) of the cached contents."""
+        entries = []
+        if self.storage:
+            try:
+                project_dirs, _ = self.storage.listdir(self.storage_prefix)
+                for project_dir in project_dirs:
+                    _, names = self.storage.listdir(f"{self.storage_prefix}/{project_dir}")
+                    for name in names:
+                        if not name.endswith('.json'):
+                            name = f"{self.storage_prefix}/{project_dir}/{name}"
+                            entries.append(
+                                (self.storage.get_modified_time(name), self.storage.size(name), name)
+                            )
+            except (OSError, NotImplementedError) as e:
+                logger.warning(f"Failed to list the file content cache: {e}")
+            return entries
+
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith(('.json', '.tmp')):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, os.path.relpath(path, self.directory)))
+        return entries
+
+    def _remove(self, name):
+        for entry_name in (name, f"{name}.json"):
+            try:
+                if self.storage:
+                    self.storage.delete(entry_name)
+                else:
+                    os.remove(os.path.join(self.directory, entry_name))
+            except OSError:
+                pass
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / total if total else 0.0,
+        }
+
+    def _get_name(self, project_pk, file_id):
+        # File ids are checked, as they become part of the path
+        if not file_id.replace('-', '').replace('_', '').isalnum():
+            raise ValueError(f"Invalid file id: {file_id}")
+        if self.storage:
+            return f"{self.storage_prefix}/{project_pk}/{file_id}"
+        return f"{project_pk}/{file_id}"
+
+
+def get_cached_response(cached, content_type=None, filename=None, range_header=None):
+    """
+    Serves a cached file content; FileResponse sets the Content-Length and lets the server use sendfile.
+    A single byte range is served as a partial content; other ranges are ignored and the whole content is served.
+    """
+    file, meta = cached
+    content_type = content_type or meta.get('content_type') or 'application/octet-stream'
+
+    byte_range = None
+    if range_header:
+        size = get_size(file)
+        byte_range = parse_range(range_header, size)
+
+    if byte_range is None:
+        response = FileResponse(
+            file,
+            content_type=content_type,
+            as_attachment=filename is not None,
+            filename=filename or '',
+        )
+    elif byte_range is False:
+        file.close()
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f"bytes */{size}"
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(iter_range(file, start, end), content_type=content_type, status=206)
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f"bytes {start}-{end}/{size}"
+        if filename is not None:
+            response['Content-Disposition'] = f'attachment; filename="{filename}"'
+
+    response['Accept-Ranges'] = 'bytes'
+    response['X-Cache'] = 'HIT'
+    return response
+
+
+def get_size(file):
+    position = file.tell()
+    file.seek(0, os.SEEK_END)
+    size = file.tell()
+    file.seek(position)
+    return size
+
+
+def parse_range(range_header, size):
+    """
+    Returns the (start, end) bytes of a single range of a Range header, inclusive;
+    False if the range can't be satisfied, or None if the header isn't a single byte range.
+    """
+    match = re.fullmatch(r'\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*', range_header)
+    if not match or match.group(1) == match.group(2) == '':
+        return None
+    first, last = match.groups()
+    if first == '':
+        # The last bytes of the content
+        if int(last) == 0:
+            return False
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if last and int(last) < start:
+            return None
+    if start >= size:
+        return False
+    return start, end
+
+
+def iter_range(file, start, end, chunk_size=64 * 1024):
+    try:
+        file.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = file.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+
+
+file_cache = FileContentCache(
+    directory=settings.FILE_CACHE_DIR,
+    storage_alias=settings.FILE_CACHE_STORAGE,
+    max_bytes=settings.FILE_CACHE_MAX_BYTES,
+)
@@ -0,0 +1,77 @@
+import asyncio
+import weakref
+
+from django.conf import settings
+from ..main.cache import MISSING, TTLCache
+
+
+class MetadataCache:
+    """
+    Caches the metadata of the OpenAI objects (files, assistants) that are looked up while rendering threads.
+
+    Entries are kept per project for `ttl` seconds. Concurrent lookups of the same object share a single
+    request, and at most `concurrency` requests are sent at a time from an event loop. Failed lookups are
+    not cached. The request runs in its own task, so that it completes for the other lookups when the one
+    that started it is cancelled.
+    """
+
+    def __init__(self, maxsize=4096, ttl=300, concurrency=8):
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.concurrency = concurrency
+        # Tasks and semaphores are bound to the event loop they are created in
+        self._loops = weakref.WeakKeyDictionary()  # loop -> (semaphore, in-flight tasks by key)
+
+    async def get(self, key, fetch):
+        value = self.cache.get(key, MISSING)
+        if value is not MISSING:
+            return value
+
+        loop = asyncio.get_running_loop()
+        if loop not in self._loops:
+            self._loops[loop] = (asyncio.Semaphore(self.concurrency), {})
+        semaphore, pending = self._loops[loop]
+
+        task = pending.get(key)
+        if task is None:
+            task = pending[key] = loop.create_task(self._fetch(key, fetch, semaphore))
+            task.add_done_callback(lambda _: self._done(pending, key, task))
+        # Cancelling a lookup leaves the request running for the others
+        return await asyncio.shield(task)
+
+    async def _fetch(self, key, fetch, semaphore):
+        async with semaphore:
+            value = await fetch()
+        self.cache.set(key, value)
+        return value
+
+    @staticmethod
+    def _done(pending, key, task):
+        if pending.get(key) is task:
+            del pending[key]
+        if not task.cancelled():
+            task.exception()  # Marks the exception as retrieved, in case nobody is waiting
+
+    async def get_file(self, client, project, file_id):
+        return await self.get(('file', project.pk, file_id), lambda: client.files.retrieve(file_id))
+
+    async def get_assistant(self, client, project, assistant_id):
+        return await self.get(
+            ('assistant', project.pk, assistant_id),
+            lambda: client.beta.assistants.retrieve(assistant_id=assistant_id),
+        )
+
+    def invalidate_file(self, project, file_id):
+        self.cache.delete(('file', project.pk, file_id))
+
+    def invalidate_assistant(self, project, assistant_id):
+        self.cache.delete(('assistant', project.pk, assistant_id))
+
+    def stats(self):
+        return self.cache.stats()
+
+
+metadata_cache = MetadataCache(
+    maxsize=settings.METADATA_CACHE_SIZE,
+    ttl=settings.METADATA_CACHE_TTL,
+    concurrency=settings.METADATA_CONCURRENCY,
+)
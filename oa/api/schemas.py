@@ -57,6 +57,7 @@ class VectorStoreSchema(Schema):
 
 class VectorStoreFilesUpdateSchema(Schema):
     file_ids: list[str] | None = Field(default=None)
+    poll: bool = False  # wait until the added files are processed
 
 
 class VectorStoreIdsSchema(Schema):
@@ -0,0 +1,434 @@
+import asyncio
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, RequestFactory
+from openai import AsyncOpenAI, OpenAIError
+from openai.types.beta.threads import Text, TextDelta
+from ..main.models import Project, SharedLink
+from .auth import BearerAuth, SharedBearerAuth, auth_cache
+from .clients import ClientRegistry
+from .files import FileContentCache, get_cached_response
+from .metadata import MetadataCache
+from .threads import get_thread_history, history_cache
+from .utils import APIError, EventHandler, relay_events
+
+
+class BearerAuthTests(TestCase):
+    def setUp(self):
+        auth_cache.clear()
+        self.project = Project.objects.create(key='sk-test')
+        self.token = str(self.project.uuid)
+        self.factory = RequestFactory()
+
+    def authenticate(self, auth, request=None):
+        request = request or self.factory.get('/', HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        return async_to_sync(auth.authenticate)(request, self.token)
+
+    def test_page_load_resolves_token_once(self):
+        # A dashboard page load calls the assistants, functions and folders APIs with the same token
+        with self.assertNumQueries(1):
+            for auth in (SharedBearerAuth(), BearerAuth(), BearerAuth()):
+                result = self.authenticate(auth)
+                self.assertEqual(result['project'], self.project)
+
+    def test_token_is_memoized_on_request(self):
+        request = self.factory.get('/', HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        with self.assertNumQueries(1):
+            self.authenticate(BearerAuth(), request)
+            auth_cache.clear()
+            self.authenticate(BearerAuth(), request)
+
+    def test_saving_project_invalidates_cache(self):
+        self.authenticate(BearerAuth())
+        self.project.key = 'sk-changed'
+        self.project.save()
+
+        with self.assertNumQueries(1):
+            result = self.authenticate(BearerAuth())
+        self.assertEqual(result['project'].key, 'sk-changed')
+        self.assertEqual(result['client'].api_key, 'sk-changed')
+
+    def test_invalid_token_is_rejected(self):
+        self.token = '00000000-0000-0000-0000-000000000000'
+        self.assertIsNone(self.authenticate(BearerAuth()))
+
+    def test_malformed_token_is_rejected(self):
+        self.token = 'abc'
+        self.assertIsNone(self.authenticate(BearerAuth()))
+
+    def test_malformed_shared_token_is_forbidden(self):
+        request = self.factory.get('/', {'token': 'abc'})
+        with self.assertRaises(APIError) as context:
+            async_to_sync(SharedBearerAuth().authenticate)(request, None)
+        self.assertEqual(context.exception.status, 403)
+
+
+    def test_revocation_by_another_worker_applies_after_the_local_ttl(self):
+        self.assertEqual(auth_cache.local.ttl, settings.AUTH_CACHE_LOCAL_TTL)
+        user = User.objects.create(username='owner')
+        link = SharedLink.objects.create(assistant_id='asst_1', project=self.project, user=user)
+        request = self.factory.get('/', {'token': str(link.token)})
+        with mock.patch.object(auth_cache.local, 'ttl', .05):
+            self.assertEqual(async_to_sync(SharedBearerAuth().authenticate)(request, None)['project'], self.project)
+
+        # Revoked without the signals of this process, as done by another worker
+        SharedLink.objects.filter(pk=link.pk).update(token=uuid.uuid4())
+        time.sleep(.1)
+        request = self.factory.get('/', {'token': str(link.token)})
+        with self.assertRaises(APIError):
+            async_to_sync(SharedBearerAuth().authenticate)(request, None)
+
+
+class FileContentCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.cache = FileContentCache(directory=self.directory, max_bytes=1000)
+
+    def store(self, file_id, size):
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(b'x' * size)
+        self.cache._store(1, file_id, temp_path, {'content_type': 'text/plain'})
+
+    def test_entries_are_listed_only_when_the_cache_is_full(self):
+        with mock.patch.object(self.cache, '_list_entries', wraps=self.cache._list_entries) as list_entries:
+            for index in range(3):
+                self.store(f"file-{index}", 300)
+            self.assertEqual(list_entries.call_count, 1)
+
+            self.store('file-3', 300)
+            self.assertEqual(list_entries.call_count, 2)
+
+        self.assertIsNone(self.cache.open(1, 'file-0'))
+        self.assertIsNotNone(self.cache.open(1, 'file-3'))
+        self.assertEqual(self.cache._size, 900)
+
+    def cached_response(self, range_header):
+        return get_cached_response((io.BytesIO(b'0123456789'), {}), filename='a.txt', range_header=range_header)
+
+    def test_range_is_served_from_the_cached_content(self):
+        response = self.cached_response('bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(response['Content-Length'], '4')
+
+        response = self.cached_response('bytes=-3')
+        self.assertEqual(b''.join(response.streaming_content), b'789')
+        self.assertEqual(response['Content-Range'], 'bytes 7-9/10')
+
+        response = self.cached_response('bytes=8-')
+        self.assertEqual(b''.join(response.streaming_content), b'89')
+
+    def test_unsatisfiable_range_is_rejected(self):
+        response = self.cached_response('bytes=10-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */10')
+
+    def test_other_ranges_get_the_whole_content(self):
+        response = self.cached_response('bytes=0-1,4-5')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+
+
+class MetadataCacheTests(SimpleTestCase):
+    async def test_lookup_completes_for_the_others_when_its_leader_is_cancelled(self):
+        cache = MetadataCache()
+        calls = 0
+        release = asyncio.Event()
+
+        async def fetch():
+            nonlocal calls
+            calls += 1
+            await release.wait()
+            return 'metadata'
+
+        leader = asyncio.create_task(cache.get('key', fetch))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(cache.get('key', fetch))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        release.set()
+
+        self.assertEqual(await waiter, 'metadata')
+        self.assertTrue(leader.cancelled())
+        self.assertEqual(calls, 1)
+        self.assertEqual(await cache.get('key', fetch), 'metadata')
+        self.assertEqual(calls, 1)
+
+    async def test_failed_lookup_is_not_cached(self):
+        cache = MetadataCache()
+
+        async def fail():
+            raise ValueError('unavailable')
+
+        async def fetch():
+            return 'metadata'
+
+        with self.assertRaises(ValueError):
+            await cache.get('key', fail)
+        self.assertEqual(await cache.get('key', fetch), 'metadata')
+
+
+class FakeMessages:
+    def __init__(self, messages):
+        self.messages = messages
+
+    def list(self, thread_id, order, limit, after=None):
+        ids = [message.id for message in self.messages]
+        start = ids.index(after) + 1 if after else 0
+
+        async def paginate():
+            for message in self.messages[start:]:
+                yield message
+        return paginate()
+
+
+class ThreadHistoryTests(SimpleTestCase):
+    def setUp(self):
+        self.project = SimpleNamespace(pk='thread-history-tests')
+        self.addCleanup(history_cache.local.delete, history_cache._key(self.project, 'thread'))
+        annotation = SimpleNamespace(text='[source]', file_citation=SimpleNamespace(file_id='file-1'))
+        self.messages = [
+            SimpleNamespace(
+                id=f"msg-{index}", role='user', status='completed',
+                content=[SimpleNamespace(
+                    type='text',
+                    text=SimpleNamespace(value=f"See [source] {index}", annotations=[annotation] if index else []),
+                )],
+            )
+            for index in range(3)
+        ]
+        self.retrieve_calls = 0
+
+        async def retrieve(file_id):
+            self.retrieve_calls += 1
+            if self.retrieve_calls == 1:
+                raise OpenAIError('Temporary failure')
+            return SimpleNamespace(filename='report.pdf')
+
+        self.client = SimpleNamespace(
+            beta=SimpleNamespace(threads=SimpleNamespace(messages=FakeMessages(self.messages))),
+            files=SimpleNamespace(retrieve=retrieve),
+        )
+
+    async def test_messages_rendered_with_fallbacks_are_not_cached(self):
+        history = await get_thread_history(self.client, self.project, 'thread')
+        self.assertIn('(Reference file is not available)', history[1]['message'])
+        entry = await history_cache.aget(self.project, 'thread')
+        self.assertEqual(entry['watermark'], 'msg-0')
+
+        history = await get_thread_history(self.client, self.project, 'thread')
+        self.assertEqual([message['id'] for message in history], ['msg-0', 'msg-1', 'msg-2'])
+        self.assertIn('(report.pdf)', history[1]['message'])
+        self.assertIn('(report.pdf)', history[2]['message'])
+        entry = await history_cache.aget(self.project, 'thread')
+        self.assertEqual(entry['watermark'], 'msg-2')
+
+
+class ModelsHandler(BaseHTTPRequestHandler):
+    """Stands for the OpenAI API, answering every request with an empty model list"""
+    protocol_version = 'HTTP/1.1'  # Keeps the connections alive
+    disable_nagle_algorithm = True  # The headers and the body are written apart
+    connections = 0
+
+    def setup(self):
+        super().setup()
+        type(self).connections += 1
+
+    def do_GET(self):
+        body = json.dumps({'object': 'list', 'data': []}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ClientRegistryTests(SimpleTestCase):
+    requests = 20
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), ModelsHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_port}/v1"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        ModelsHandler.connections = 0
+        patcher = mock.patch.dict(os.environ, {'OPENAI_BASE_URL': self.base_url})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    async def settle():
+        for _ in range(5):
+            await asyncio.sleep(0)
+
+    async def test_evicted_clients_are_closed(self):
+        registry = ClientRegistry(max_clients=1, close_delay=0)
+        first = registry.get(SimpleNamespace(uuid='a', key='key-a'))
+        second = registry.get(SimpleNamespace(uuid='b', key='key-b'))
+        await self.settle()
+        self.assertTrue(first.is_closed())
+        self.assertFalse(second.is_closed())
+
+        registry.reset('b')
+        await self.settle()
+        self.assertTrue(second.is_closed())
+
+    async def test_client_is_replaced_and_closed_when_the_key_rotates(self):
+        registry = ClientRegistry(close_delay=0)
+        old = registry.get(SimpleNamespace(uuid='a', key='old-key'))
+        self.assertIs(registry.get(SimpleNamespace(uuid='a', key='old-key')), old)
+
+        new = registry.get(SimpleNamespace(uuid='a', key='new-key'))
+        await self.settle()
+        self.assertIsNot(new, old)
+        self.assertEqual(new.api_key, 'new-key')
+        self.assertTrue(old.is_closed())
+        registry.clear()
+
+    async def test_pooled_client_is_faster_than_a_client_per_request(self):
+        # Benchmark against the stub server: a client per request, as before the registry, then the pooled one
+        started_at = time.perf_counter()
+        for _ in range(self.requests):
+            client = AsyncOpenAI(api_key='key')
+            await client.models.list()
+            await client.close()
+        fresh_latency = (time.perf_counter() - started_at) / self.requests
+        fresh_connections = ModelsHandler.connections
+
+        ModelsHandler.connections = 0
+        registry = ClientRegistry(close_delay=0)
+        project = SimpleNamespace(uuid='a', key='key')
+        started_at = time.perf_counter()
+        for _ in range(self.requests):
+            await registry.get(project).models.list()
+        pooled_latency = (time.perf_counter() - started_at) / self.requests
+        registry.clear()
+        await self.settle()
+
+        self.assertEqual(fresh_connections, self.requests)
+        self.assertEqual(ModelsHandler.connections, 1)
+        self.assertLess(pooled_latency, fresh_latency)
+
+
+class RelayTests(SimpleTestCase):
+    """Feeds EventHandler and relay_events from a fake source standing for the run stream"""
+
+    def setUp(self):
+        self.request = SimpleNamespace(auth={'project': SimpleNamespace(pk=1)})
+
+    async def source(self, handler, tokens, delay=0, error=None):
+        await handler.on_message_created(None)
+        text = ''
+        for token in tokens:
+            if delay:
+                await asyncio.sleep(delay)
+            text += token
+            await handler.on_text_delta(TextDelta(value=token), Text(value=text, annotations=[]))
+        if error:
+            raise error
+        await handler.on_message_done(None)
+        await handler.on_end()
+
+    @staticmethod
+    def parse(chunk):
+        return json.loads(chunk.removeprefix('data: ').removesuffix('\n\n'))
+
+    async def test_events_are_relayed_in_order_until_the_end(self):
+        queue = asyncio.Queue(maxsize=4)
+        handler = EventHandler(request=self.request, queue=queue)
+        events = [self.parse(chunk) async for chunk in relay_events(
+            queue, lambda: self.source(handler, ['Hel', 'lo', ' world'])
+        )]
+
+        self.assertEqual(
+            [event['type'] for event in events],
+            ['message_created', 'text_delta', 'text_delta', 'text_delta', 'message_done', 'end_of_stream'],
+        )
+        self.assertEqual([event['text'] for event in events[1:4]], ['Hel', 'Hello', 'Hello world'])
+        self.assertEqual(events[4]['text'], 'Hello world')
+
+    async def test_error_is_relayed_after_the_events_before_it(self):
+        queue = asyncio.Queue(maxsize=4)
+        handler = EventHandler(request=self.request, queue=queue, delta=True)
+        events = [self.parse(chunk) async for chunk in relay_events(
+            queue, lambda: self.source(handler, ['a', 'b'], error=OpenAIError('Run failed'))
+        )]
+
+        self.assertEqual([event.get('delta') for event in events[1:3]], ['a', 'b'])
+        self.assertEqual(events[-1], {'type': 'error', 'message': 'Run failed'})
+
+    async def test_producer_waits_while_the_client_falls_behind(self):
+        queue = asyncio.Queue(maxsize=2)
+        handler = EventHandler(request=self.request, queue=queue)
+        relay = relay_events(queue, lambda: self.source(handler, ['x'] * 20))
+
+        first = await relay.__anext__()
+        await asyncio.sleep(.05)
+        # The producer is blocked on the full queue with its third token, rather than buffering the whole run
+        self.assertEqual(queue.qsize(), 2)
+        self.assertEqual(handler.current_message, 'xxx')
+
+        remaining = [chunk async for chunk in relay]
+        self.assertEqual(self.parse(first)['type'], 'message_created')
+        self.assertEqual(len(remaining), 20 + 2)
+
+    async def test_producer_is_cancelled_when_the_client_disconnects(self):
+        queue = asyncio.Queue(maxsize=2)
+        cancelled = asyncio.Event()
+
+        async def produce():
+            try:
+                while True:
+                    await queue.put({'type': 'text_delta'})
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        relay = relay_events(queue, produce)
+        await relay.__anext__()
+        await relay.aclose()
+        await asyncio.wait_for(cancelled.wait(), 1)
+
+    async def test_tokens_are_relayed_as_they_are_produced(self):
+        # Benchmark of the time to the first byte and between the tokens, with a token every 10 ms
+        queue = asyncio.Queue(maxsize=256)
+        handler = EventHandler(request=self.request, queue=queue, delta=True)
+        started_at = time.perf_counter()
+        arrivals = []
+        async for chunk in relay_events(queue, lambda: self.source(handler, ['token '] * 20, delay=.01)):
+            if self.parse(chunk).get('delta'):
+                arrivals.append(time.perf_counter() - started_at)
+
+        gaps = [later - earlier for earlier, later in zip(arrivals, arrivals[1:])]
+        self.assertEqual(len(arrivals), 20)
+        self.assertLess(arrivals[0], .01 + .05)
+        self.assertLess(sum(gaps) / len(gaps), .01 + .005)
@@ -0,0 +1,254 @@
+import asyncio
+import logging
+from collections import deque
+
+from django.conf import settings
+from django.core.cache import caches
+from django.urls import reverse
+from openai import OpenAIError
+from .metadata import metadata_cache
+from .utils import get_image_url
+from ..main.cache import TTLCache, MISSING
+
+
+logger = logging.getLogger(__name__)
+
+
+class ThreadHistoryCache:
+    """
+    Caches the rendered messages of the threads along with a watermark, the id of the last message that
+    can no longer change. Only the messages after the watermark are fetched and rendered again.
+    Entries are kept in an in-process LRU, or in the Django cache given by THREAD_HISTORY_CACHE_ALIAS.
+    """
+
+    def __init__(self, maxsize=256, ttl=3600, alias=None):
+        self.ttl = ttl
+        self.alias = alias
+        self.local = None if alias else TTLCache(maxsize=maxsize, ttl=ttl)
+        self.hits = 0
+        self.misses = 0
+
+    async def aget(self, project, thread_id):
+        if self.local is not None:
+            entry = self.local.get(self._key(project, thread_id), MISSING)
+        else:
+            entry = await caches[self.alias].aget(self._key(project, thread_id), MISSING)
+
+        if entry is MISSING:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    async def aset(self, project, thread_id, watermark, messages):
+        entry = {'watermark': watermark, 'messages': messages}
+        if self.local is not None:
+            self.local.set(self._key(project, thread_id), entry)
+        else:
+            await caches[self.alias].aset(self._key(project, thread_id), entry, self.ttl)
+
+    async def adelete(self, project, thread_id):
+        if self.local is not None:
+            self.local.delete(self._key(project, thread_id))
+        else:
+            await caches[self.alias].adelete(self._key(project, thread_id))
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'backend': self.alias or 'memory',
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / total if total else 0.0,
+            'size': len(self.local) if self.local is not None else None,
+        }
+
+    @staticmethod
+    def _key(project, thread_id):
+        return f"oa:thread_history:{project.pk}:{thread_id}"
+
+
+history_cache = ThreadHistoryCache(
+    maxsize=settings.THREAD_HISTORY_CACHE_SIZE,
+    ttl=settings.THREAD_HISTORY_CACHE_TTL,
+    alias=settings.THREAD_HISTORY_CACHE_ALIAS,
+)
+
+
+async def list_messages(client, thread_id, after=None):
+    """Returns all the messages of the thread after the given message, walking every page"""
+    paginator = client.beta.threads.messages.list(
+        thread_id=thread_id,
+        order='asc',
+        limit=100,
+        **({'after': after} if after else {}),
+    )
+    return [message async for message in paginator]
+
+
+async def get_thread_history(client, project, thread_id):
+    """
+    Returns the rendered messages of the thread.
+    The cached messages are reused and only the messages after the watermark are fetched and rendered.
+    """
+    entry = await history_cache.aget(project, thread_id)
+    rendered, watermark = (entry['messages'], entry['watermark']) if entry else ([], None)
+
+    try:
+        messages = await list_messages(client, thread_id, after=watermark)
+    except OpenAIError as e:
+        if not watermark:
+            raise
+        # The watermark message may have been deleted
+        logger.warning(f"Failed to list the messages of thread {thread_id} after {watermark}: {e}")
+        await history_cache.adelete(project, thread_id)
+        rendered, watermark = [], None
+        messages = await list_messages(client, thread_id)
+
+    results = await asyncio.gather(*[render_message(client, project, message) for message in messages])
+    new_messages = [message for message, _ in results]
+
+    # The watermark isn't moved past a message that is still being written, nor past one rendered with
+    # fallbacks after a failed lookup, so that it is rendered again next time
+    completed = 0
+    for message, (_, degraded) in zip(messages, results):
+        if message.status == 'in_progress' or degraded:
+            break
+        completed += 1
+    if completed:
+        await history_cache.aset(project, thread_id, messages[completed - 1].id, rendered + new_messages[:completed])
+
+    return rendered + new_messages
+
+
+async def get_thread_messages_since(client, project, thread_id, message_id):
+    """Returns the rendered messages of the thread that come after the given message"""
+    history = await get_thread_history(client, project, thread_id)
+    for index, message in enumerate(history):
+        if message['id'] == message_id:
+            return history[index + 1:]
+
+    # Not in the history, e.g. a message created after it was fetched
+    messages = await list_messages(client, thread_id, after=message_id)
+    return await asyncio.gather(*[format_message(client, project, message) for message in messages])
+
+
+async def get_thread_messages_page(client, project, thread_id, after=None, limit=20):
+    """Returns a page of the rendered messages, oldest first, and whether there are more"""
+    page = await client.beta.threads.messages.list(
+        thread_id=thread_id,
+        order='asc',
+        limit=limit,
+        **({'after': after} if after else {}),
+    )
+    messages = await asyncio.gather(*[format_message(client, project, message) for message in page.data])
+    return messages, page.has_more
+
+
+async def iter_thread_messages(client, project, thread_id, after=None, window=None):
+    """
+    Yields the rendered messages of the thread in order, as soon as each one is ready.
+    Messages are rendered concurrently, at most `window` ahead of the one being yielded. When starting from the
+    beginning of the thread, the cached history is yielded first and only the messages after it are fetched.
+    """
+    window = window or settings.METADATA_CONCURRENCY
+    if not after and (entry := await history_cache.aget(project, thread_id)):
+        for message in entry['messages']:
+            yield message
+        after = entry['watermark']
+
+    paginator = client.beta.threads.messages.list(
+        thread_id=thread_id,
+        order='asc',
+        limit=100,
+        **({'after': after} if after else {}),
+    )
+    pending = deque()
+    try:
+        async for message in paginator:
+            pending.append(asyncio.ensure_future(format_message(client, project, message)))
+            if len(pending) >= window:
+                yield await pending.popleft()
+        while pending:
+            yield await pending.popleft()
+    finally:
+        # The client may have disconnected
+        for task in pending:
+            task.cancel()
+
+
+async def format_message(client, project, message):
+    """Renders the content of a thread message as HTML, with the name of its author"""
+    rendered, _ = await render_message(client, project, message)
+    return rendered
+
+
+async def render_message(client, project, message):
+    """Returns the rendered message and whether fallbacks were used because a lookup failed"""
+    role = message.role
+    content = ""
+    degraded = False
+    if message.content:
+        for content_item in message.content:
+            if content_item.type == "text":
+                text_content = content_item.text.value
+                annotations = content_item.text.annotations
+
+                for index, annotation in enumerate(annotations):
+                    # Fetch file citation
+                    if file_citation := getattr(annotation, 'file_citation', None):
+                        citation_file_id = getattr(file_citation, 'file_id', None)
+                        try:
+                            cited_file = await metadata_cache.get_file(client, project, citation_file_id)
+                            file_info = f'({cited_file.filename})'
+                        except OpenAIError as e:
+                            logger.warning(f"File with id {citation_file_id} not found: {e}")
+                            file_info = '(Reference file is not available)'
+                            degraded = True
+
+                        # Replace the annotation text with the file info
+                        text_content = text_content.replace(annotation.text, f' [{index + 1}] {file_info}')
+
+                    # Fetch file path
+                    if file_path := getattr(annotation, 'file_path', None):
+                        file_path_file_id = getattr(file_path, 'file_id', None)
+
+                        download_link = reverse(
+                            'api-1.0.0:download_file_trigger',
+                            kwargs={'file_id': file_path_file_id}
+                        )
+
+                        html_snippet = (
+                            f'<a href="#" onclick="downloadFile(\'{download_link}\')">'
+                            f'<i class="bi bi-cloud-download"></i></a>'
+                        )
+
+                        text_content = text_content.replace(annotation.text, html_snippet)
+
+                content += f"<p>{text_content}</p>"
+
+            elif content_item.type == "image_file":
+                image_url = get_image_url(project, content_item.image_file.file_id)
+                content += f'<p><img src="{image_url}" style="max-width: 100%;"></p>'
+            else:
+                content += f"<p>Unsupported content type: {content_item.type}</p>"
+
+    # Fetch assistant name if role is 'assistant'
+    if role == 'assistant':
+        try:
+            assistant_response = await metadata_cache.get_assistant(client, project, message.assistant_id)
+            name = assistant_response.name
+        except OpenAIError as e:
+            logger.warning(f"Assistant with id {message.assistant_id} not found: {e}")
+            name = "assistant"
+            degraded = True
+    else:
+        name = role
+
+    rendered = {
+        "id": message.id,
+        "role": role,
+        "name": name,
+        "message": content
+    }
+    return rendered, degraded
@@ -1,13 +1,21 @@
-import base64
+import asyncio
+import json
 import logging
 from typing import Any
+from urllib.parse import quote
 
+from django.conf import settings
+from django.core import signing
+from django.http import JsonResponse, StreamingHttpResponse
+from django.urls import reverse
 from openai import AsyncAssistantEventHandler
 from openai.types.beta.threads import Text, TextDelta, ImageFile
 
 
 logger = logging.getLogger(__name__)
 
+IMAGE_URL_SALT = "oa.api.image"
+
 
 class APIError(Exception):
     def __init__(self, message, status=500):
@@ -16,6 +24,94 @@ class APIError(Exception):
         super().__init__(self.message)
 
 
+def get_image_url(project, file_id):
+    """
+    Returns the URL of the image endpoint for the given file.
+    The URL is signed for the project, so that it can be used in <img> tags without the Bearer token.
+    """
+    signed = signing.Signer(salt=IMAGE_URL_SALT).sign(f"{project.pk}:{file_id}")
+    return f"{reverse('api-1.0.0:get_image_file', kwargs={'file_id': file_id})}?key={quote(signed)}"
+
+
+def unsign_image_key(key):
+    """Returns the project pk and the file id of a signed image key; raises BadSignature if it is not valid."""
+    project_pk, file_id = signing.Signer(salt=IMAGE_URL_SALT).unsign(key).split(":", 1)
+    return int(project_pk), file_id
+
+
+async def open_file_stream(client, file_id, headers=None):
+    """
+    Starts streaming the content of an OpenAI file.
+    Returns the upstream response and an async iterator over its chunks, which closes the response when done.
+    """
+    manager = client.files.with_streaming_response.content(file_id, extra_headers=headers)
+    response = await manager.__aenter__()
+
+    async def iter_chunks():
+        try:
+            async for chunk in response.iter_bytes(settings.FILE_STREAM_CHUNK_SIZE):
+                yield chunk
+        finally:
+            await manager.__aexit__(None, None, None)
+
+    return response, iter_chunks()
+
+
+def get_page_params(**params):
+    """Returns the cursor parameters given in the request, to be passed to an OpenAI list method."""
+    return {name: value for name, value in params.items() if value is not None}
+
+
+async def list_response(request, key, paginator):
+    """
+    Returns a page of the OpenAI list as JSON, with the cursors to request the adjacent pages.
+    With `?format=ndjson` every page is walked instead, streaming one item per line.
+    """
+    if request.GET.get('format') == 'ndjson':
+        return StreamingHttpResponse(iter_ndjson(paginator), content_type='application/x-ndjson')
+
+    page = await paginator
+    return JsonResponse({
+        key: serialize_to_dict(page.data),
+        'has_more': getattr(page, 'has_more', False),
+        'first_id': page.data[0].id if page.data else None,
+        'last_id': page.data[-1].id if page.data else None,
+    })
+
+
+async def iter_ndjson(paginator):
+    # The next page is requested only when the previous one is consumed
+    try:
+        async for item in paginator:
+            yield json.dumps(serialize_to_dict(item)) + "\n"
+    except Exception as e:
+        logger.error(f"Listing failed: {e}")
+        yield json.dumps({"error": str(e)}) + "\n"
+
+
+async def relay_events(queue, produce):
+    """
+    Yields the events that `produce` puts into the queue as server-sent events, as soon as they arrive.
+    `produce` runs in its own task; an exception it raises is passed to the client as an error event.
+    With a bounded queue the producer waits while the client falls behind, and it is cancelled when the client
+    disconnects before the end.
+    """
+    async def run():
+        try:
+            await produce()
+        except Exception as e:
+            await queue.put({"type": "error", "message": str(e)})
+        # Marks the end of the relay
+        await queue.put(None)
+
+    producer = asyncio.create_task(run())
+    try:
+        while (data := await queue.get()) is not None:
+            yield f"data: {json.dumps(data)}\n\n"
+    finally:
+        producer.cancel()
+
+
 def serialize_to_dict(obj: Any) -> Any:
     """Recursively convert an object to a serializable dictionary."""
     if isinstance(obj, (str, int, float, bool, type(None))):
@@ -33,22 +129,33 @@ def serialize_to_dict(obj: Any) -> Any:
 
 
 class EventHandler(AsyncAssistantEventHandler):
-    def __init__(self, request, shared_data):
+    def __init__(self, request, queue: asyncio.Queue, delta=False):
         super().__init__()
         self.request = request
         self.current_message = ""
-        self.shared_data = shared_data
+        self.current_length = 0  # in UTF-16 code units, as the offsets are compared with JavaScript string lengths
+        self.queue = queue
         self.stream_done = False
         self.current_annotations = []
 
+        # In delta mode text_delta events carry only the appended text and the new or changed annotations,
+        # with a full snapshot every STREAM_SNAPSHOT_INTERVAL events for the client to resync
+        self.delta = delta
+        self.sent_annotations = []
+        self.delta_count = 0
+
     async def on_message_created(self, message):
         self.current_message = ""
+        self.current_length = 0
         self.current_annotations = []
-        self.shared_data.append({"type": "message_created"})
+        self.sent_annotations = []
+        self.delta_count = 0
+        await self.queue.put({"type": "message_created"})
 
     async def on_text_delta(self, delta: TextDelta, snapshot: Text):
+        offset = self.current_length
         if delta.value:
-            self.current_message += delta.value
+            self.append(delta.value)
 
         # Collect annotations from the snapshot
         self.current_annotations = []
@@ -65,35 +172,60 @@ class EventHandler(AsyncAssistantEventHandler):
 
                 self.current_annotations.append(annotation_dict)
 
+        if self.delta:
+            await self.queue.put(self.get_delta_event(delta.value or "", offset))
+            return
+
         # Send the updated message and annotations to the client
-        self.shared_data.append({
+        await self.queue.put({
             "type": "text_delta",
             "text": self.current_message,
             "annotations": self.current_annotations
         })
 
+    def append(self, text):
+        self.current_message += text
+        self.current_length += len(text.encode('utf-16-le')) // 2
+
+    def get_delta_event(self, text, offset):
+        self.delta_count += 1
+        if self.delta_count % settings.STREAM_SNAPSHOT_INTERVAL == 0:
+            event = {
+                "type": "text_delta",
+                "text": self.current_message,
+                "annotations": self.current_annotations,
+                "snapshot": True,
+            }
+        else:
+            # The offset lets the client detect a missed event and wait for the next snapshot
+            event = {
+                "type": "text_delta",
+                "delta": text,
+                "offset": offset,
+                "annotations": [
+                    {**annotation, "index": index}
+                    for index, annotation in enumerate(self.current_annotations)
+                    if index >= len(self.sent_annotations) or self.sent_annotations[index] != annotation
+                ],
+            }
+        self.sent_annotations = self.current_annotations
+        return event
+
     async def on_message_done(self, message):
         # Send the final message content and annotations to the client
-        self.shared_data.append({
+        await self.queue.put({
             "type": "message_done",
             "text": self.current_message,
             "annotations": self.current_annotations
         })
 
     async def on_image_file_done(self, image_file: ImageFile) -> None:
-        try:
-            content_response = await self.request.auth['client'].files.content(image_file.file_id)
-            image_binary = content_response.read()
-            image_base64 = base64.b64encode(image_binary).decode('utf-8')
-            image_data = f"data:image/png;base64,{image_base64}"
-
-            self.current_message += f'<p><img src="{image_data}" style="max-width: 100%;"></p>'
-        except APIError as e:
-            logger.warning(f"Error fetching image file with id {image_file.file_id}: {e}")
-            self.current_message += f"<p>(Error fetching image file)</p>"
+        # Images are served by reference, so the stream and the following deltas stay small
+        image_url = get_image_url(self.request.auth['project'], image_file.file_id)
+        self.append(f'<p><img src="{image_url}" style="max-width: 100%;"></p>')
 
         # Send an SSE event that includes the updated current_message
-        self.shared_data.append({
+        await self.queue.put({
             "type": "image_file",
             "text": self.current_message,
             "annotations": []
@@ -101,4 +233,4 @@ class EventHandler(AsyncAssistantEventHandler):
 
     async def on_end(self):
         self.stream_done = True
-        self.shared_data.append({"type": "end_of_stream"})
+        await self.queue.put({"type": "end_of_stream"})
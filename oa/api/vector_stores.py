@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import time
+
+from django.conf import settings
+from openai import OpenAIError
+
+
+logger = logging.getLogger(__name__)
+
+
+class VectorStoreSync:
+    """
+    Brings the files of a vector store in line with the given file ids.
+
+    All the current files are listed page by page to compute the difference.
+    Removals run concurrently, at most `concurrency` at a time. Additions are sent as file batches of
+    at most `batch_size` files, and are optionally polled until the batches are processed.
+    """
+
+    def __init__(self, client, vector_store_id, concurrency=None, batch_size=None, poll=False):
+        self.client = client
+        self.vector_store_id = vector_store_id
+        self.semaphore = asyncio.Semaphore(concurrency or settings.VECTOR_STORE_SYNC_CONCURRENCY)
+        self.batch_size = batch_size or settings.VECTOR_STORE_BATCH_SIZE
+        self.poll = poll
+
+    async def list_file_ids(self):
+        paginator = self.client.vector_stores.files.list(
+            vector_store_id=self.vector_store_id,
+            limit=100,
+        )
+        return {file.id async for file in paginator}
+
+    async def remove_file(self, file_id):
+        async with self.semaphore:
+            await self.client.vector_stores.files.delete(
+                vector_store_id=self.vector_store_id,
+                file_id=file_id,
+            )
+
+    async def add_batch(self, file_ids):
+        async with self.semaphore:
+            if self.poll:
+                return await self.client.vector_stores.file_batches.create_and_poll(
+                    vector_store_id=self.vector_store_id,
+                    file_ids=file_ids,
+                )
+            return await self.client.vector_stores.file_batches.create(
+                vector_store_id=self.vector_store_id,
+                file_ids=file_ids,
+            )
+
+    async def run(self, file_ids):
+        """Returns a report of the files added and removed, the batches created and the time spent on each step."""
+        started_at = time.monotonic()
+        timings = {}
+        failed = {}
+
+        current_file_ids = await self.list_file_ids()
+        timings['list'] = time.monotonic() - started_at
+
+        file_ids = set(file_ids)
+        file_ids_to_add = sorted(file_ids - current_file_ids)
+        file_ids_to_remove = sorted(current_file_ids - file_ids)
+        logger.info(
+            f"Syncing vector store {self.vector_store_id}: {len(current_file_ids)} current files, "
+            f"{len(file_ids_to_add)} to add, {len(file_ids_to_remove)} to remove."
+        )
+
+        step_started_at = time.monotonic()
+        results = await asyncio.gather(
+            *[self.remove_file(file_id) for file_id in file_ids_to_remove],
+            return_exceptions=True,
+        )
+        removed = []
+        for file_id, result in zip(file_ids_to_remove, results):
+            if isinstance(result, OpenAIError):
+                logger.warning(f"Failed to remove file {file_id} from vector store {self.vector_store_id}: {result}")
+                failed[file_id] = str(result)
+            elif isinstance(result, BaseException):
+                raise result
+            else:
+                removed.append(file_id)
+        timings['remove'] = time.monotonic() - step_started_at
+
+        step_started_at = time.monotonic()
+        chunks = [
+            file_ids_to_add[start:start + self.batch_size]
+            for start in range(0, len(file_ids_to_add), self.batch_size)
+        ]
+        results = await asyncio.gather(*[self.add_batch(chunk) for chunk in chunks], return_exceptions=True)
+        added, batches = [], []
+        for chunk, result in zip(chunks, results):
+            if isinstance(result, OpenAIError):
+                logger.warning(f"Failed to add {len(chunk)} files to vector store {self.vector_store_id}: {result}")
+                failed.update({file_id: str(result) for file_id in chunk})
+            elif isinstance(result, BaseException):
+                raise result
+            else:
+                added.extend(chunk)
+                batches.append({
+                    'id': result.id,
+                    'status': result.status,
+                    'file_counts': result.file_counts.to_dict(),
+                })
+        timings['add'] = time.monotonic() - step_started_at
+        timings['total'] = time.monotonic() - started_at
+
+        return {
+            'vector_store_id': self.vector_store_id,
+            'current_count': len(current_file_ids),
+            'added': added,
+            'removed': removed,
+            'failed': failed,
+            'batches': batches,
+            'timings': {step: round(seconds, 3) for step, seconds in timings.items()},
+        }
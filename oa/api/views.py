@@ -1,67 +1,43 @@
 import asyncio
-import base64
 import json
 import logging
 import os
 import httpx
 from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.urls import reverse
-from django.http import JsonResponse, StreamingHttpResponse, HttpResponse, Http404, HttpResponseNotFound
+from django.core import signing
+from django.http import JsonResponse, StreamingHttpResponse, HttpResponse, HttpResponseNotModified, Http404, \
+    HttpResponseNotFound
 from ninja import NinjaAPI, File, Form
-from ninja.errors import AuthenticationError
-from ninja.security import HttpBearer
 from ninja.files import UploadedFile
 from typing import List
-from openai import AsyncOpenAI, OpenAIError
+from openai import OpenAIError, APIStatusError
 from .schemas import AssistantSchema, VectorStoreSchema, VectorStoreIdsSchema, FileUploadSchema, ThreadSchema, \
     AssistantSharedLink, VectorStoreFilesUpdateSchema
-from .utils import serialize_to_dict, APIError, EventHandler
-from ..function_calls.models import BaseAPIFunction, LocalAPIFunction, ExternalAPIFunction, FunctionExecution
+from .auth import SharedBearerAuth
+from .clients import get_client
+from .files import file_cache, get_cached_response
+from .metadata import metadata_cache
+from .threads import get_thread_history, get_thread_messages_since, get_thread_messages_page, iter_thread_messages
+from .vector_stores import VectorStoreSync
+from .utils import serialize_to_dict, EventHandler, unsign_image_key, open_file_stream, \
+    get_page_params, list_response, relay_events
+from ..function_calls.executions import execution_logger
+from ..function_calls.registry import get_function_registry
+from ..function_calls.models import BaseAPIFunction
 from ..main.models import Project, SharedLink, Thread
 from ..main.utils import format_time
 
 
-api = NinjaAPI()
+api = NinjaAPI(auth=SharedBearerAuth())
 
 logger = logging.getLogger(__name__)
 
 
-class BearerAuth(HttpBearer):
-    async def authenticate(self, request, token: str):
-        if token:
-            try:
-                project = await Project.objects.aget(uuid=token)
-            except Project.DoesNotExist:
-                return AuthenticationError("Invalid or missing Bearer token.")
-
-            try:
-                client = AsyncOpenAI(api_key=project.key)
-            except APIError as e:
-                return JsonResponse({"error": e.message}, status=e.status)
-        else:
-            # User is anonymous, check for shared token
-            shared_token = request.headers.get('X-Token') or request.GET.get('token')
-
-            if shared_token:
-                try:
-                    shared_link = await SharedLink.objects.select_related('project').aget(token=shared_token)
-                    project = shared_link.project
-                    client = AsyncOpenAI(api_key=project.key)
-
-                except SharedLink.DoesNotExist:
-                    raise APIError("Invalid or missing shared token.", status=403)
-            else:
-                raise APIError("Authentication required.", status=401)
-
-        return {
-            'project': project,
-            'client': client,
-        }
-
-
 # Shared link administration
 
-@api.post("/sharedlink", auth=BearerAuth())
+@api.post("/sharedlink")
 def retrieve_or_create_shared_link(request, data: AssistantSharedLink):
     if data.token:
         link = SharedLink.objects.filter(
@@ -100,7 +76,7 @@ def retrieve_or_create_shared_link(request, data: AssistantSharedLink):
     })
 
 
-@api.get("/sharedlinks/{assistant_id}", auth=BearerAuth())
+@api.get("/sharedlinks/{assistant_id}")
 def list_shared_links(request, assistant_id):
     try:
         links = SharedLink.objects.filter(
@@ -125,7 +101,7 @@ def list_shared_links(request, assistant_id):
     return JsonResponse({"shared_links": shared_links})
 
 
-@api.delete("/sharedlink/{link_token}", auth=BearerAuth())
+@api.delete("/sharedlink/{link_token}")
 def delete_shared_link(request, link_token):
     link = SharedLink.objects.filter(
         project=request.auth['project'],
@@ -147,7 +123,7 @@ def delete_shared_link(request, link_token):
     })
 
 
-@api.post("/update/sharedlink", auth=BearerAuth())
+@api.post("/update/sharedlink")
 def update_shared_link(request, data: AssistantSharedLink):
     try:
         link = SharedLink.objects.get(
@@ -179,7 +155,7 @@ def update_shared_link(request, data: AssistantSharedLink):
 
 # Assistants
 
-@api.post("/assistants", auth=BearerAuth())
+@api.post("/assistants")
 async def create_assistant(request, payload: AssistantSchema):
     # Use the tools and tool_resources from the payload
     tools = payload.tools or []
@@ -201,19 +177,18 @@ async def create_assistant(request, payload: AssistantSchema):
     return JsonResponse(serialize_to_dict(assistant), status=201)
 
 
-@api.get("/assistants", auth=BearerAuth())
-async def list_assistants(request):
+@api.get("/assistants")
+async def list_assistants(request, after: str = None, before: str = None, limit: int = 100):
     try:
-        assistants = await request.auth['client'].beta.assistants.list(order="desc", limit=100)
+        return await list_response(request, 'assistants', request.auth['client'].beta.assistants.list(
+            order="desc",
+            **get_page_params(after=after, before=before, limit=limit),
+        ))
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
-    return JsonResponse({
-        'assistants': serialize_to_dict(assistants.data)
-    })
-
 
-@api.get("/assistants/{assistant_id}", auth=BearerAuth())
+@api.get("/assistants/{assistant_id}")
 async def retrieve_assistant(request, assistant_id):
     try:
         assistant = await request.auth['client'].beta.assistants.retrieve(assistant_id)
@@ -223,7 +198,7 @@ async def retrieve_assistant(request, assistant_id):
     return JsonResponse(serialize_to_dict(assistant))
 
 
-@api.post("/assistants/{assistant_id}", auth=BearerAuth())
+@api.post("/assistants/{assistant_id}")
 async def modify_assistant(request, assistant_id, payload: AssistantSchema):
     # Use tools and tool_resources from the payload
     tools = payload.tools or []
@@ -242,21 +217,23 @@ async def modify_assistant(request, assistant_id, payload: AssistantSchema):
         )
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
+    metadata_cache.invalidate_assistant(request.auth['project'], assistant_id)
 
     return JsonResponse(serialize_to_dict(assistant), status=200)
 
 
-@api.delete("/assistants/{assistant_id}", auth=BearerAuth())
+@api.delete("/assistants/{assistant_id}")
 async def delete_assistant(request, assistant_id):
     try:
         assistant = await request.auth['client'].beta.assistants.delete(assistant_id)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
+    metadata_cache.invalidate_assistant(request.auth['project'], assistant_id)
 
     return JsonResponse(serialize_to_dict(assistant))
 
 
-@api.get("/assistants/{assistant_id}/threads", auth=BearerAuth())
+@api.get("/assistants/{assistant_id}/threads")
 async def list_threads(request, assistant_id):
     """
     Returns the thread information for the given assistant
@@ -291,7 +268,7 @@ async def list_threads(request, assistant_id):
 
 # Vector Stores
 
-@api.post("/vector_stores", auth=BearerAuth())
+@api.post("/vector_stores")
 async def create_vector_store(request, payload: VectorStoreSchema):
     expiration_days = payload.expiration_days if payload.expiration_days is not None else None
 
@@ -314,20 +291,18 @@ async def create_vector_store(request, payload: VectorStoreSchema):
     return JsonResponse(serialize_to_dict(vector_store), status=201)
 
 
-@api.get("/vector_stores", auth=BearerAuth())
-async def list_vector_stores(request):
+@api.get("/vector_stores")
+async def list_vector_stores(request, after: str = None, before: str = None, limit: int = 100):
     try:
-        vector_stores = await request.auth['client'].vector_stores.list(
+        return await list_response(request, 'vector_stores', request.auth['client'].vector_stores.list(
             order="desc",
-            limit=100,
-        )
+            **get_page_params(after=after, before=before, limit=limit),
+        ))
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
-    return JsonResponse({"vector_stores": serialize_to_dict(vector_stores.data)})
-
 
-@api.get("/vector_stores/{vector_store_id}", auth=BearerAuth())
+@api.get("/vector_stores/{vector_store_id}")
 async def retrieve_vector_store(request, vector_store_id):
     try:
         vector_store = await request.auth['client'].vector_stores.retrieve(vector_store_id)
@@ -337,7 +312,7 @@ async def retrieve_vector_store(request, vector_store_id):
     return JsonResponse(serialize_to_dict(vector_store))
 
 
-@api.post("/vector_stores/{vector_store_id}", auth=BearerAuth())
+@api.post("/vector_stores/{vector_store_id}")
 async def modify_vector_store(request, vector_store_id, payload: VectorStoreSchema):
     expires_after = None
     if payload.expiration_days:
@@ -359,7 +334,7 @@ async def modify_vector_store(request, vector_store_id, payload: VectorStoreSche
     return JsonResponse(serialize_to_dict(vector_store), status=201)
 
 
-@api.delete("/vector_stores/{vector_store_id}", auth=BearerAuth())
+@api.delete("/vector_stores/{vector_store_id}")
 async def delete_vector_store(request, vector_store_id):
     try:
         vector_store = await request.auth['client'].vector_stores.delete(vector_store_id)
@@ -371,21 +346,19 @@ async def delete_vector_store(request, vector_store_id):
 
 # Vector Store Files
 
-@api.get("/vector_stores/{vector_store_id}/files", auth=BearerAuth())
-async def list_vector_store_files(request, vector_store_id):
+@api.get("/vector_stores/{vector_store_id}/files")
+async def list_vector_store_files(request, vector_store_id, after: str = None, before: str = None, limit: int = 100):
     try:
-        vector_store_files = await request.auth['client'].vector_stores.files.list(
+        return await list_response(request, 'files', request.auth['client'].vector_stores.files.list(
             vector_store_id=vector_store_id,
             order="desc",
-            limit=100,
-        )
+            **get_page_params(after=after, before=before, limit=limit),
+        ))
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
-    return JsonResponse({"files": serialize_to_dict(vector_store_files.data)})
-
 
-@api.get("/vector_stores/{vector_store_id}/files/{file_id}", auth=BearerAuth())
+@api.get("/vector_stores/{vector_store_id}/files/{file_id}")
 async def retrieve_vector_store_file(request, vector_store_id, file_id):
     try:
         vector_store_file = await request.auth['client'].vector_stores.files.retrieve(
@@ -398,75 +371,32 @@ async def retrieve_vector_store_file(request, vector_store_id, file_id):
     return JsonResponse(serialize_to_dict(vector_store_file))
 
 
-@api.post("/vector_stores/{vector_store_id}/sync", auth=BearerAuth())
+@api.post("/vector_stores/{vector_store_id}/sync")
 async def sync_vector_store_files(request, vector_store_id, payload: VectorStoreFilesUpdateSchema):
-    try:
-        new_file_ids = set(payload.file_ids)
+    if payload.file_ids is None:
+        return JsonResponse({"error": "file_ids is required."}, status=400)
 
-        # Retrieve current files in the vector store
-        current_files = await request.auth['client'].vector_stores.files.list(
-            vector_store_id=vector_store_id,
-            order="desc",
-            limit=100,
-        )
-        # TODO: Pagination will be added for 100+ files
-
-        current_file_ids = {file.id for file in current_files.data}
-
-        # Files to add and remove
-        file_ids_to_add = new_file_ids - current_file_ids
-        file_ids_to_remove = current_file_ids - new_file_ids
-
-        print('current_file_ids:', current_file_ids)
-        print('file_ids_to_add:', file_ids_to_add)
-        print('file_ids_to_remove:', file_ids_to_remove)
-
-        # Remove files not in new_file_ids
-        if file_ids_to_remove:
-            async def delete_vector_store_file(file_id):
-                try:
-                    await request.auth['client'].vector_stores.files.delete(
-                        vector_store_id=vector_store_id,
-                        file_id=file_id
-                    )
-                except OpenAIError as e:
-                    logger.warning(f"Failed to delete file {file_id}: {e}")
-
-            # Create deletion tasks concurrently
-            delete_tasks = [delete_vector_store_file(file_id) for file_id in file_ids_to_remove]
-            await asyncio.gather(*delete_tasks)
-
-        # Add new files (using batch if more than one)
-        if file_ids_to_add:
-            if len(file_ids_to_add) > 1:
-                response = await request.auth['client'].vector_stores.file_batches.create(
-                    vector_store_id=vector_store_id,
-                    file_ids=list(file_ids_to_add)
-                )
-            else:
-                response = await request.auth['client'].vector_stores.files.create(
-                    vector_store_id=vector_store_id,
-                    file_id=list(file_ids_to_add)[0]
-                )
-        else:
-            response = {"message": "No new files added."}
+    try:
+        report = await VectorStoreSync(
+            request.auth['client'],
+            vector_store_id,
+            poll=payload.poll,
+        ).run(payload.file_ids)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
-    return JsonResponse(serialize_to_dict(response))
+    return JsonResponse(report)
 
 
 # Files
 
-@api.post("/files/upload", auth=BearerAuth())
+@api.post("/files/upload")
 async def upload_files(
         request,
         files: List[UploadedFile] = File(...),
         payload: FileUploadSchema = Form(...)
 ):
 
-    uploaded_files, failed_files, supported_files = [], [], []
-
     # Define the supported file types for file search (same as the client-side)
     supported_file_types = {
         ".c": "text/x-c",
@@ -493,66 +423,110 @@ async def upload_files(
         extension = file_name[file_name.rfind("."):].lower()
         return extension in supported_file_types
 
-    # Handle file uploads
-    for uploaded_file in files:
+    client = request.auth['client']
+    vector_store_ids = payload.vector_store_ids or []
+
+    # With ?progress=sse the events below are streamed to the client as the uploads complete
+    queue = asyncio.Queue() if request.GET.get('progress') == 'sse' else None
+    completed = 0
+
+    async def report(event):
+        if queue is not None:
+            await queue.put(event)
+
+    async def upload_file(uploaded_file, semaphore):
+        nonlocal completed
         try:
-            # Upload the file
-            response = await request.auth['client'].files.create(
-                file=(uploaded_file.name, uploaded_file.file),
-                purpose="assistants"
-            )
-            uploaded_file_info = json.loads(response.json())
-            uploaded_files.append(uploaded_file_info)
+            async with semaphore:
+                # The file object is passed as is, so the SDK reads it from Django's temporary file
+                response = await client.files.create(
+                    file=(uploaded_file.name, uploaded_file.file),
+                    purpose="assistants"
+                )
+        except Exception as e:
+            completed += 1
+            failed_file = {"filename": uploaded_file.name, "error": str(e)}
+            await report({"type": "file_failed", **failed_file, "completed": completed, "total": len(files)})
+            return None, failed_file
+
+        completed += 1
+        uploaded_file_info = json.loads(response.json())
+        await report({"type": "file_uploaded", "file": uploaded_file_info, "completed": completed, "total": len(files)})
+        return uploaded_file_info, None
 
+    async def attach_files(vector_store_id, file_ids):
+        try:
+            if len(file_ids) > 1:
+                # Batch assignment for multiple files
+                await client.vector_stores.file_batches.create(vector_store_id=vector_store_id, file_ids=file_ids)
+            else:
+                # Assign a single file
+                await client.vector_stores.files.create(vector_store_id=vector_store_id, file_id=file_ids[0])
+        except Exception as e:
+            logger.warning(f"Failed to attach files to vector store {vector_store_id}: {e}")
+            await report({"type": "vector_store_failed", "vector_store_id": vector_store_id, "error": str(e)})
+            return {"vector_store_id": vector_store_id, "error": str(e)}
+        await report({"type": "vector_store_attached", "vector_store_id": vector_store_id})
+
+    async def run_upload():
+        # Uploads run concurrently; the results are kept in the order of the files
+        semaphore = asyncio.Semaphore(settings.FILE_UPLOAD_CONCURRENCY)
+        results = await asyncio.gather(*[upload_file(uploaded_file, semaphore) for uploaded_file in files])
+
+        uploaded_files, failed_files, supported_files = [], [], []
+        for uploaded_file, (uploaded_file_info, failed_file) in zip(files, results):
+            if failed_file:
+                failed_files.append(failed_file)
+                continue
+            uploaded_files.append(uploaded_file_info)
             # If the file is supported, add it to the supported_files list
             if is_supported_file(uploaded_file.name):
                 supported_files.append(uploaded_file_info)
 
-        except Exception as e:
-            failed_files.append({
-                "filename": uploaded_file.name,
-                "error": str(e)
-            })
+        # Only attach supported files to vector stores if any vector stores are selected
+        failed_vector_stores = []
+        if supported_files:
+            file_ids = [f['id'] for f in supported_files]
+            failed_vector_stores = [
+                failure for failure in await asyncio.gather(*[
+                    attach_files(vector_store_id, file_ids) for vector_store_id in vector_store_ids
+                ]) if failure
+            ]
 
-    # Only attach supported files to vector stores if any vector stores are selected
-    vector_store_ids = payload.vector_store_ids or []
-    for vector_store_id in vector_store_ids:
-        if len(supported_files) > 1:
-            # Batch assignment for multiple files
-            await request.auth['client'].vector_stores.file_batches.create(
-                vector_store_id=vector_store_id,
-                file_ids=[f['id'] for f in supported_files]
-            )
-        elif len(supported_files) == 1:
-            # Assign a single file
-            await request.auth['client'].vector_stores.files.create(
-                vector_store_id=vector_store_id,
-                file_id=supported_files[0]['id']
-            )
+        return {
+            "uploaded_files": uploaded_files,
+            "failed_files": failed_files,
+            "supported_files": supported_files,
+            "vector_store_ids": vector_store_ids,
+            "failed_vector_stores": failed_vector_stores,
+        }
 
-    return JsonResponse({
-        "uploaded_files": uploaded_files,
-        "failed_files": failed_files,
-        "supported_files": supported_files,
-        "vector_store_ids": vector_store_ids,
-    })
+    if queue is None:
+        return JsonResponse(await run_upload())
+
+    async def produce():
+        await queue.put({"type": "done", **await run_upload()})
+
+    response = StreamingHttpResponse(relay_events(queue, produce), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # For Nginx
+    return response
 
 
-@api.get("/files", auth=BearerAuth())
-async def list_files(request):
+@api.get("/files")
+async def list_files(request, after: str = None, limit: int = 10000):  # Max = 10,000
     try:
-        files = await request.auth['client'].files.list(
+        # The files API has no `before` cursor
+        return await list_response(request, 'files', request.auth['client'].files.list(
             purpose='assistants',
-            limit=10000,  # Default = Max = 10,000
             order='desc',
-        )
+            **get_page_params(after=after, limit=limit),
+        ))
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
-    return JsonResponse({"files": serialize_to_dict(files.data)})
-
 
-@api.get("/files/{file_id}", auth=BearerAuth())
+@api.get("/files/{file_id}")
 async def retrieve_file(request, file_id):
     try:
         file = await request.auth['client'].files.retrieve(file_id)
@@ -562,7 +536,7 @@ async def retrieve_file(request, file_id):
     return JsonResponse(serialize_to_dict(file))
 
 
-@api.post("/files/{file_id}/vector_stores/add", auth=BearerAuth())
+@api.post("/files/{file_id}/vector_stores/add")
 async def add_file_to_vector_stores(request, file_id, payload: VectorStoreIdsSchema):
     """Adds the file to the given vector stores."""
     status = {'success': [], 'error': []}
@@ -580,7 +554,7 @@ async def add_file_to_vector_stores(request, file_id, payload: VectorStoreIdsSch
     return JsonResponse(serialize_to_dict(status))
 
 
-@api.post("/files/{file_id}/vector_stores/remove", auth=BearerAuth())
+@api.post("/files/{file_id}/vector_stores/remove")
 async def remove_file_from_vector_stores(request, file_id, payload: VectorStoreIdsSchema):
     """Removes the file from the given vector stores."""
     status = {'success': [], 'error': []}
@@ -598,19 +572,20 @@ async def remove_file_from_vector_stores(request, file_id, payload: VectorStoreI
     return JsonResponse(serialize_to_dict(status))
 
 
-@api.delete("/files/{file_id}", auth=BearerAuth())
+@api.delete("/files/{file_id}")
 async def delete_file(request, file_id):
     try:
         response = await request.auth['client'].files.delete(file_id)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
+    metadata_cache.invalidate_file(request.auth['project'], file_id)
 
     return JsonResponse(serialize_to_dict(response))
 
 
 # Threads
 
-@api.post("/threads/create/{assistant_id}", auth=BearerAuth())
+@api.post("/threads/create/{assistant_id}")
 async def create_thread(request, assistant_id):
     try:
         response = await request.auth['client'].beta.threads.create(metadata={
@@ -622,7 +597,7 @@ async def create_thread(request, assistant_id):
     return JsonResponse(serialize_to_dict(response))
 
 
-@api.get("/threads/{thread_id}", auth=BearerAuth())
+@api.get("/threads/{thread_id}")
 async def retrieve_thread(request, thread_id):
     try:
         thread = await request.auth['client'].beta.threads.retrieve(thread_id)
@@ -632,7 +607,7 @@ async def retrieve_thread(request, thread_id):
     return JsonResponse(serialize_to_dict(thread))
 
 
-@api.post("/threads/{thread_id}", auth=BearerAuth())
+@api.post("/threads/{thread_id}")
 async def modify_thread(request, thread_id, payload: ThreadSchema):
     # Prepare parameters for update
     update_params = {}
@@ -655,7 +630,7 @@ async def modify_thread(request, thread_id, payload: ThreadSchema):
     return JsonResponse(serialize_to_dict(thread), status=200)
 
 
-@api.post("/threads/{thread_id}/messages", auth=BearerAuth())
+@api.post("/threads/{thread_id}/messages")
 async def create_message(request, thread_id):
     try:
         # Parse JSON body
@@ -706,22 +681,18 @@ async def create_message(request, thread_id):
 
 # Runs
 
-@api.get("/threads/{thread_id}/runs", auth=BearerAuth())
-async def list_runs(request, thread_id):
+@api.get("/threads/{thread_id}/runs")
+async def list_runs(request, thread_id, after: str = None, before: str = None, limit: int = 100):
     try:
-        runs = await request.auth['client'].beta.threads.runs.list(
+        return await list_response(request, 'runs', request.auth['client'].beta.threads.runs.list(
             thread_id=thread_id,
-            limit=100,
-        )
+            **get_page_params(after=after, before=before, limit=limit),
+        ))
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
-    return JsonResponse({
-        'runs': serialize_to_dict(runs.data)
-    })
-
 
-@api.get("/threads/{thread_id}/runs/{run_id}", auth=BearerAuth())
+@api.get("/threads/{thread_id}/runs/{run_id}")
 async def retrieve_run(request, thread_id, run_id):
     try:
         run = await request.auth['client'].beta.threads.runs.retrieve(
@@ -734,7 +705,7 @@ async def retrieve_run(request, thread_id, run_id):
     return JsonResponse(serialize_to_dict(run))
 
 
-@api.post("/threads/{thread_id}/runs/{run_id}/cancel", auth=BearerAuth())
+@api.post("/threads/{thread_id}/runs/{run_id}/cancel")
 async def cancel_run(request, thread_id, run_id):
     try:
         run = await request.auth['client'].beta.threads.runs.cancel(
@@ -751,229 +722,170 @@ async def cancel_run(request, thread_id, run_id):
 
 # Chat
 
-@sync_to_async
-def log_function_execution(function, thread, arguments, result, status_code, error_message):
-    return FunctionExecution.objects.create(
+def log_function_execution(function, thread, arguments, result, status_code, error_message, cached=False):
+    # Buffered and written in batches in the background
+    execution_logger.log(
         function=function,
-        executed_version=function.version,
+        executed_version=getattr(function, 'version', None),
         thread=thread,
         arguments=arguments,
         result=result,
         status_code=status_code,
         error_message=error_message,
+        cached=cached,
     )
 
-@api.get("/stream/{assistant_id}/{thread_id}", auth=BearerAuth())
-async def stream_responses(request, assistant_id: str, thread_id: str):
-    async def event_stream():
-        shared_data = []
-        event_handler = EventHandler(request=request, shared_data=shared_data)
-        try:
-            thread = await Thread.objects.filter(openai_id=thread_id).afirst()
-
-            async with request.auth['client'].beta.threads.runs.stream(
-                thread_id=thread_id,
-                assistant_id=assistant_id,
-                event_handler=event_handler,
-            ) as stream:
-                # Process events as they arrive
-                async for event in stream:
-                    # Handle 'requires_action' events here
-                    if event.event == "thread.run.requires_action":
-                        run_id = event.data.id
-                        required_action = event.data.required_action
-                        if required_action.type == "submit_tool_outputs":
-                            tool_calls = required_action.submit_tool_outputs.tool_calls
-                            tool_outputs = []
-
-                            for tool_call in tool_calls:
-                                # function = await ExternalAPIFunction.objects.filter(slug=tool_call.function.name).afirst()
-                                function = await LocalAPIFunction.objects.filter(slug=tool_call.function.name).afirst()
-
-                                if not function:
-                                    tool_outputs.append({
-                                        "tool_call_id": tool_call.id,
-                                        "output": json.dumps(
-                                            {"error": f"No function named '{tool_call.function.name}'"}
-                                        ),
-                                    })
-                                    continue
-
-                                try:
-                                    args_dict = json.loads(tool_call.function.arguments or "{}")
-                                except Exception as e:
-                                    tool_outputs.append({
-                                        "tool_call_id": tool_call.id,
-                                        "output": json.dumps(
-                                            {"error": f"Invalid arguments JSON: {str(e)}"}
-                                        ),
-                                    })
-                                    continue
-
-                                try:
-                                    result = await function.execute(**args_dict)
-                                    status_code = "200"
-                                    error_message = None
-                                except Exception as e:
-                                    result = {"error": str(e)}
-                                    status_code = "400"
-                                    error_message = str(e)
-
-                                # Log the execution
-                                await log_function_execution(
-                                    function=function,
-                                    thread=thread,
-                                    arguments=args_dict,
-                                    result=result,
-                                    status_code=status_code,
-                                    error_message=error_message
-                                )
-
-                                # Prepare output for the assistant
-                                tool_outputs.append({
-                                    "tool_call_id": tool_call.id,
-                                    "output": json.dumps(result)
-                                })
-
-                            tool_output_event_handler = EventHandler(
-                                request=request, shared_data=shared_data
-                            )
-                            async with request.auth['client'].beta.threads.runs.submit_tool_outputs_stream(
-                                thread_id=thread_id,
-                                run_id=run_id,
-                                tool_outputs=tool_outputs,
-                                event_handler=tool_output_event_handler,
-                            ) as tool_output_stream:
-                                # Process events from the tool output stream
-                                async for tool_event in tool_output_stream:
-                                    while shared_data:
-                                        data = shared_data.pop(0)
-                                        yield f"data: {json.dumps(data)}\n\n"
-
-                                        await asyncio.sleep(0)
-
-                    # Yield data to the client immediately
-                    while shared_data:
-                        data = shared_data.pop(0)
-                        yield f"data: {json.dumps(data)}\n\n"
-
-                        # Flush the response to the client
-                        await asyncio.sleep(0)  # Yield control to the event loop
-
-                # After the stream ends, process any remaining shared_data
-                while shared_data:
-                    data = shared_data.pop(0)
-                    yield f"data: {json.dumps(data)}\n\n"
-                    await asyncio.sleep(0)  # Yield control to the event loop
-                    if data.get("type") == "end_of_stream":
-                        return
 
+async def execute_tool_call(tool_call, functions, thread, semaphore):
+    """
+    Executes the function requested by the tool call and returns the tool output for the run
+    """
+    function = functions.get(tool_call.function.name)
+
+    if not function:
+        return {
+            "tool_call_id": tool_call.id,
+            "output": json.dumps({"error": f"No function named '{tool_call.function.name}'"}),
+        }
+
+    try:
+        args_dict = json.loads(tool_call.function.arguments or "{}")
+    except Exception as e:
+        return {
+            "tool_call_id": tool_call.id,
+            "output": json.dumps({"error": f"Invalid arguments JSON: {str(e)}"}),
+        }
+
+    timeout = function.timeout or settings.TOOL_CALL_TIMEOUT
+    async with semaphore:
+        try:
+            result, cached = await asyncio.wait_for(function.execute_cached(**args_dict), timeout=timeout)
+            status_code = "200"
+            error_message = None
+        except asyncio.TimeoutError:
+            cached = False
+            error_message = f"Function timed out after {timeout} seconds."
+            result = {"error": error_message}
+            status_code = "504"
         except Exception as e:
-            # Yield an error message to the client
-            error_data = {"type": "error", "message": str(e)}
-            yield f"data: {json.dumps(error_data)}\n\n"
+            cached = False
+            result = {"error": str(e)}
+            status_code = "400"
+            error_message = str(e)
+
+    # Log the execution; the built-in tools have no records
+    if isinstance(function, BaseAPIFunction):
+        log_function_execution(
+            function=function,
+            thread=thread,
+            arguments=args_dict,
+            result=result,
+            status_code=status_code,
+            error_message=error_message,
+            cached=cached,
+        )
+
+    # Prepare output for the assistant
+    return {
+        "tool_call_id": tool_call.id,
+        "output": json.dumps(result)
+    }
+
 
-    response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+@api.get("/stream/{assistant_id}/{thread_id}")
+async def stream_responses(request, assistant_id: str, thread_id: str):
+    # The run is streamed by a producer task that pushes the events into a bounded queue, and relay_events
+    # passes them to the client as soon as they arrive. When the client falls behind, the queue
+    # fills up and the producer waits, which keeps the memory bounded.
+    queue = asyncio.Queue(maxsize=settings.STREAM_QUEUE_SIZE)
+
+    # Clients can opt in to the delta-only text events with ?mode=delta
+    delta = request.GET.get('mode') == 'delta'
+
+    async def run_stream():
+        event_handler = EventHandler(request=request, queue=queue, delta=delta)
+        thread = await Thread.objects.filter(openai_id=thread_id).afirst()
+        functions = await get_function_registry(request.auth['project'], assistant_id)
+
+        async with request.auth['client'].beta.threads.runs.stream(
+            thread_id=thread_id,
+            assistant_id=assistant_id,
+            event_handler=event_handler,
+        ) as stream:
+            # Process events as they arrive
+            async for event in stream:
+                # Handle 'requires_action' events here
+                if event.event == "thread.run.requires_action":
+                    run_id = event.data.id
+                    required_action = event.data.required_action
+                    if required_action.type == "submit_tool_outputs":
+                        tool_calls = required_action.submit_tool_outputs.tool_calls
+
+                        # Run the tool calls concurrently; the outputs are gathered in the order of the calls
+                        semaphore = asyncio.Semaphore(settings.TOOL_CALL_CONCURRENCY)
+                        tool_outputs = await asyncio.gather(*[
+                            execute_tool_call(tool_call, functions, thread, semaphore) for tool_call in tool_calls
+                        ])
+
+                        tool_output_event_handler = EventHandler(request=request, queue=queue, delta=delta)
+                        async with request.auth['client'].beta.threads.runs.submit_tool_outputs_stream(
+                            thread_id=thread_id,
+                            run_id=run_id,
+                            tool_outputs=tool_outputs,
+                            event_handler=tool_output_event_handler,
+                        ) as tool_output_stream:
+                            # The handler relays the events of the tool output stream
+                            await tool_output_stream.until_done()
+
+    response = StreamingHttpResponse(relay_events(queue, run_stream), content_type='text/event-stream')
     response['Cache-Control'] = 'no-cache'
     response['X-Accel-Buffering'] = 'no'  # For Nginx
     return response
 
 
-@api.get("/thread/{thread_id}/messages", auth=BearerAuth())
-async def get_thread_messages(request, thread_id):
-    try:
-        response = await request.auth['client'].beta.threads.messages.list(
-            thread_id=thread_id,
-            order='asc',
-        )
-        messages = response.data
-
-        async def format_message(message):
-            role = message.role
-            content = ""
-            if message.content:
-                for content_item in message.content:
-                    if content_item.type == "text":
-                        text_content = content_item.text.value
-                        annotations = content_item.text.annotations
-
-                        for index, annotation in enumerate(annotations):
-                            # Fetch file citation
-                            if file_citation := getattr(annotation, 'file_citation', None):
-                                citation_file_id = getattr(file_citation, 'file_id', None)
-                                try:
-                                    cited_file = await request.auth['client'].files.retrieve(citation_file_id)
-                                    file_info = f'({cited_file.filename})'
-                                except OpenAIError as e:
-                                    logger.warning(f"File with id {citation_file_id} not found: {e}")
-                                    file_info = '(Reference file is not available)'
-
-                                # Replace the annotation text with the file info
-                                text_content = text_content.replace(annotation.text, f' [{index + 1}] {file_info}')
-
-                            # Fetch file path
-                            if file_path := getattr(annotation, 'file_path', None):
-                                file_path_file_id = getattr(file_path, 'file_id', None)
-
-                                download_link = reverse(
-                                    'api-1.0.0:download_file_trigger',
-                                    kwargs={'file_id': file_path_file_id}
-                                )
-
-                                html_snippet = f'<a href="#" onclick="downloadFile(\'{download_link}\')"><i class="bi bi-cloud-download"></i></a>'
-
-                                text_content = text_content.replace(annotation.text, html_snippet)
-
-                        content += f"<p>{text_content}</p>"
-
-                    elif content_item.type == "image_file":
-
-                        image_file_id = content_item.image_file.file_id
-
-                        # Fetch the image and embed into the message
-                        try:
-                            content_response = await request.auth['client'].files.content(image_file_id)
-                        except OpenAIError as e:
-                            logger.warning(f"Error fetching image file with id {image_file_id}: {e}")
-                            content += f"<p>(Error fetching image file)</p>"
-                        else:
-                            # Convert image content into base64 encoded data URL
-                            image_binary = content_response.read()
-                            image_base64 = base64.b64encode(image_binary).decode('utf-8')
-                            image_data = f"data:image/png;base64,{image_base64}"
-                            content += f'<p><img src="{image_data}" style="max-width: 100%;"></p>'
-                    else:
-                        content += f"<p>Unsupported content type: {content_item.type}</p>"
-
-            # Fetch assistant name if role is 'assistant'
-            if role == 'assistant':
-                try:
-                    assistant_response = await request.auth['client'].beta.assistants.retrieve(assistant_id=message.assistant_id)
-                    name = assistant_response.name
-                except OpenAIError as e:
-                    logger.warning(f"Assistant with id {message.assistant_id} not found: {e}")
-                    name = "assistant"
-            else:
-                name = role
+@api.get("/thread/{thread_id}/messages")
+async def get_thread_messages(request, thread_id, after: str = None, limit: int = None, since: str = None):
+    """
+    Returns the rendered messages of the thread, oldest first:
+    - all of them by default, or only those after the `since` message id for incremental updates,
+    - a single page of at most `limit` messages after the `after` cursor when `limit` is given,
+    - every message as a line of NDJSON, sent as soon as it is rendered, with `?format=ndjson`.
+    """
+    client = request.auth['client']
+    project = request.auth['project']
 
-            return {
-                "role": role,
-                "name": name,
-                "message": content
-            }
+    if request.GET.get('format') == 'ndjson':
+        async def message_stream():
+            try:
+                async for message in iter_thread_messages(client, project, thread_id, after=after or since):
+                    yield json.dumps(message) + "\n"
+            except Exception as e:
+                logger.error(f"Error fetching messages: {e}")
+                yield json.dumps({"error": str(e)}) + "\n"
 
-        # Run the formatting tasks concurrently
-        formatted_messages_tasks = [format_message(message) for message in messages]
-        messages = await asyncio.gather(*formatted_messages_tasks)
+        return StreamingHttpResponse(message_stream(), content_type='application/x-ndjson')
 
+    has_more = False
+    try:
+        if limit:
+            messages, has_more = await get_thread_messages_page(client, project, thread_id, after=after, limit=limit)
+        elif since:
+            messages = await get_thread_messages_since(client, project, thread_id, since)
+        else:
+            messages = await get_thread_history(client, project, thread_id)
     except Exception as e:
         logger.error(f"Error fetching messages: {e}")
         messages = []
 
-    return JsonResponse({'success': True, 'messages': messages})
+    return JsonResponse({
+        'success': True,
+        'messages': messages,
+        'has_more': has_more,
+        'last_id': messages[-1]['id'] if messages else None,
+    })
 
 
-@api.get("/thread/{thread_id}/files", auth=BearerAuth())
+@api.get("/thread/{thread_id}/files")
 async def get_thread_files(request, thread_id):
     try:
         # Retrieve the thread details from OpenAI
@@ -985,7 +897,7 @@ async def get_thread_files(request, thread_id):
 
     async def fetch_file(file_id):
         try:
-            file_response = await request.auth['client'].files.retrieve(file_id=file_id)
+            file_response = await metadata_cache.get_file(request.auth['client'], request.auth['project'], file_id)
             return {
                 "file_id": file_id,
                 "file_name": file_response.filename,
@@ -1006,35 +918,109 @@ async def get_thread_files(request, thread_id):
     return JsonResponse({'success': True, 'files': files})
 
 
-@api.get("/download-trigger/{file_id}", auth=BearerAuth())
+@api.get("/images/{file_id}", auth=None)
+async def get_image_file(request, file_id: str, key: str):
+    """
+    Serves the images generated in threads. The URLs are signed by get_image_url, so no Bearer token is needed
+    and the file contents are immutable, so the browser can cache them for good.
+    """
+    try:
+        project_pk, signed_file_id = unsign_image_key(key)
+    except (signing.BadSignature, ValueError):
+        return JsonResponse({"error": "Invalid image key."}, status=403)
+
+    if signed_file_id != file_id:
+        return JsonResponse({"error": "Invalid image key."}, status=403)
+
+    etag = f'"{file_id}"'
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponseNotModified()
+    elif cached := await file_cache.aopen(project_pk, file_id):
+        response = get_cached_response(cached)
+    else:
+        try:
+            project = await Project.objects.aget(pk=project_pk)
+            upstream, chunks = await open_file_stream(get_client(project), file_id)
+        except (Project.DoesNotExist, OpenAIError) as e:
+            logger.warning(f"Error fetching image file with id {file_id}: {e}")
+            raise Http404("Image not found.")
+
+        content_type = upstream.headers.get('Content-Type', '')
+        content_type = content_type if content_type.startswith('image/') else 'image/png'
+        response = StreamingHttpResponse(
+            file_cache.tee(project_pk, file_id, chunks, content_type) if file_cache.enabled else chunks,
+            content_type=content_type,
+        )
+        if content_length := upstream.headers.get('Content-Length'):
+            response['Content-Length'] = content_length
+        response['X-Cache'] = 'MISS'
+
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
+
+
+@api.get("/download-trigger/{file_id}")
 async def download_file_trigger(request, file_id: str):
     return await download_file(request, file_id)
 
 
-@api.get("/download/{file_id}", auth=BearerAuth())
+@api.get("/download/{file_id}")
 async def download_file(request, file_id: str):
-    try:
-        # Retrieve file metadata
-        file_info = await request.auth['client'].files.retrieve(file_id)
+    client = request.auth['client']
+    project_pk = request.auth['project'].pk
 
-        # Retrieve file content
-        file_content_response = await request.auth['client'].files.content(file_id)
-        file_content = file_content_response.read()  # Read the content as bytes
-
-        # Extract the filename from the full path
-        filename = os.path.basename(file_info.filename)
+    # The metadata of cached contents is still requested, which also checks the access
+    if cached := await file_cache.aopen(project_pk, file_id):
+        try:
+            file_info = await client.files.retrieve(file_id)
+        except Exception as e:
+            cached[0].close()
+            raise Http404(f"File not found: {e}")
+        return get_cached_response(
+            cached,
+            content_type='application/octet-stream',
+            filename=os.path.basename(file_info.filename),
+            range_header=request.headers.get('Range'),
+        )
 
-        response = HttpResponse(file_content, content_type='application/octet-stream')
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        return response
+    # Range requests are forwarded, so that resumed downloads don't transfer the whole file again
+    headers = {'Range': request.headers['Range']} if 'Range' in request.headers else None
 
-    except Exception as e:
-        raise Http404(f"File not found: {e}")
+    # The metadata and the content are requested concurrently; the content is streamed as it arrives
+    file_info, stream = await asyncio.gather(
+        client.files.retrieve(file_id),
+        open_file_stream(client, file_id, headers=headers),
+        return_exceptions=True,
+    )
+    if isinstance(stream, BaseException) or isinstance(file_info, BaseException):
+        if not isinstance(stream, BaseException):
+            await stream[0].close()
+        error = stream if isinstance(stream, BaseException) else file_info
+        if isinstance(error, APIStatusError) and error.status_code == 416:
+            return HttpResponse(status=416)
+        raise Http404(f"File not found: {error}")
+
+    upstream, chunks = stream
+    if upstream.status_code == 200 and file_cache.enabled:
+        # Only complete contents are cached
+        chunks = file_cache.tee(project_pk, file_id, chunks, upstream.headers.get('Content-Type'))
+
+    # Extract the filename from the full path
+    filename = os.path.basename(file_info.filename)
+
+    response = StreamingHttpResponse(chunks, content_type='application/octet-stream', status=upstream.status_code)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    for header in ('Content-Length', 'Content-Range', 'Accept-Ranges'):
+        if value := upstream.headers.get(header):
+            response[header] = value
+    response['X-Cache'] = 'MISS'
+    return response
 
 
 # Get started
 
-@api.post("/get_started/generate_instructions", auth=BearerAuth())
+@api.post("/get_started/generate_instructions")
 async def generate_instructions(request):
     data = json.loads(request.body)
     prompt = data.get("prompt")
@@ -1060,7 +1046,7 @@ async def generate_instructions(request):
 
 # Admin APIs
 
-@api.get("/get_costs", auth=BearerAuth())
+@api.get("/get_costs")
 async def get_costs(request):
     try:
         await request.auth['client'].models.list()
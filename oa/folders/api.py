@@ -5,42 +5,14 @@ from collections import defaultdict
 from asgiref.sync import sync_to_async
 from django.shortcuts import get_object_or_404
 from ninja import NinjaAPI, Schema, Field
-from ninja.security import HttpBearer
-from ninja.errors import AuthenticationError
-from openai import AsyncOpenAI
 from django.http import JsonResponse
-from ..main.models import Project
+from ..api.auth import BearerAuth
 from .models import Folder, FolderAssistant
 
-api = NinjaAPI(urls_namespace="folders-api")
+api = NinjaAPI(auth=BearerAuth(), urls_namespace="folders-api")
 
 
-class APIError(Exception):
-    def __init__(self, message, status=500):
-        self.message = message
-        self.status = status
-        super().__init__(self.message)
-
-
-class BearerAuth(HttpBearer):
-    async def authenticate(self, request, token: str):
-        try:
-            project = await Project.objects.aget(uuid=token)
-        except Project.DoesNotExist:
-            return AuthenticationError("Invalid or missing Bearer token.")
-
-        try:
-            client = AsyncOpenAI(api_key=project.key)
-        except APIError as e:
-            return JsonResponse({"error": e.message}, status=e.status)
-
-        return {
-            'project': project,
-            'client': client,
-        }
-
-
-@api.get("/", auth=BearerAuth())
+@api.get("/")
 async def list_folders(request):
     project = request.auth['project']
     qs = Folder.objects.filter(projects=project)
@@ -71,7 +43,7 @@ class FolderUpdateSchema(Schema):
     name: str | None = None
 
 
-@api.post("/{folder_uuid}/files/", auth=BearerAuth())
+@api.post("/{folder_uuid}/files/")
 def update_folder(request, folder_uuid: uuid.UUID, payload: FolderUpdateSchema):
     folder = get_object_or_404(Folder, uuid=folder_uuid)
     if payload.file_ids is not None:
@@ -82,7 +54,7 @@ def update_folder(request, folder_uuid: uuid.UUID, payload: FolderUpdateSchema):
     return {"file_ids": folder.file_ids, "name": folder.name}
 
 
-@api.post("/create/", auth=BearerAuth())
+@api.post("/create/")
 def create_folder(request):
     folder = Folder.objects.create(
         created_by=request.user,
@@ -91,7 +63,7 @@ def create_folder(request):
     return {"folder_uuid": folder.uuid}
 
 
-@api.delete("/{folder_uuid}/", auth=BearerAuth())
+@api.delete("/{folder_uuid}/")
 def delete_folder(request, folder_uuid: uuid.UUID):
     folder = get_object_or_404(Folder, uuid=folder_uuid)
     folder.delete()
@@ -100,7 +72,7 @@ def delete_folder(request, folder_uuid: uuid.UUID):
 
 # Assistant - Folder relations
 
-@api.get("/assistant-folders", auth=BearerAuth())
+@api.get("/assistant-folders")
 async def list_assistant_folders(request):
     project = request.auth['project']
     qs = FolderAssistant.objects.filter(folder__projects=project).select_related("folder")
@@ -111,7 +83,7 @@ async def list_assistant_folders(request):
     return {"assistant_folders": mapping}
 
 
-@api.get("/folder-assistants", auth=BearerAuth())
+@api.get("/folder-assistants")
 async def list_folder_assistants(request):
     project = request.auth['project']
     qs = FolderAssistant.objects.filter(folder__projects=project).select_related("folder")
@@ -125,7 +97,7 @@ class AssistantFolderUpdateSchema(Schema):
     folder_uuids: list[str] | None = Field(default=None)
 
 
-@api.post("/assistants/{assistant_id}/folders", auth=BearerAuth())
+@api.post("/assistants/{assistant_id}/folders")
 async def update_assistant_folders(request, assistant_id: str, payload: AssistantFolderUpdateSchema):
     project = request.auth['project']
 
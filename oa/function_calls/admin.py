@@ -57,7 +57,7 @@ class ExternalAPIFunctionAdmin(admin.ModelAdmin):
 
 @admin.register(FunctionExecution)
 class FunctionExecutionAdmin(admin.ModelAdmin):
-    list_display = ('function', 'thread', 'time', 'status_code', 'executed_version')
-    list_filter = ('status_code', 'time')
+    list_display = ('function', 'thread', 'time', 'status_code', 'executed_version', 'cached')
+    list_filter = ('status_code', 'cached', 'time')
     search_fields = ('function__name', 'thread__openai_id', 'error_message')
     ordering = ('-time',)
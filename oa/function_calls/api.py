@@ -1,42 +1,14 @@
 from asgiref.sync import sync_to_async
 from ninja import NinjaAPI
-from ninja.security import HttpBearer
-from ninja.errors import AuthenticationError
 from ninja import Schema
-from openai import AsyncOpenAI, OpenAI
 from django.http import JsonResponse
-from ..main.models import Project
+from ..api.auth import BearerAuth
 from .models import BaseAPIFunction, LocalAPIFunction, FunctionExecution, CodeInterpreterScript
 
-api = NinjaAPI(urls_namespace="functions-api")
+api = NinjaAPI(auth=BearerAuth(), urls_namespace="functions-api")
 
 
-class APIError(Exception):
-    def __init__(self, message, status=500):
-        self.message = message
-        self.status = status
-        super().__init__(self.message)
-
-
-class BearerAuth(HttpBearer):
-    async def authenticate(self, request, token: str):
-        try:
-            project = await Project.objects.aget(uuid=token)
-        except Project.DoesNotExist:
-            return AuthenticationError("Invalid or missing Bearer token.")
-
-        try:
-            client = AsyncOpenAI(api_key=project.key)
-        except APIError as e:
-            return JsonResponse({"error": e.message}, status=e.status)
-
-        return {
-            'project': project,
-            'client': client,
-        }
-
-
-@api.get("/", auth=BearerAuth())
+@api.get("/")
 async def list_functions(request):
     functions = []
     async for function in LocalAPIFunction.objects.all():
@@ -50,7 +22,7 @@ async def list_functions(request):
     return {"functions": functions}
 
 
-@api.get("/list_local_functions", auth=BearerAuth())
+@api.get("/list_local_functions")
 async def list_local_functions(request):
     try:
         functions = LocalAPIFunction.objects.filter(
@@ -81,7 +53,7 @@ async def list_local_functions(request):
     return JsonResponse({"functions": functions_data})
 
 
-@api.get("/get_function_executions/{slug}", auth=BearerAuth())
+@api.get("/get_function_executions/{slug}")
 def get_function_executions(request, slug: str):
     try:
         function_instance = BaseAPIFunction.objects.get(slug=slug)
@@ -102,6 +74,7 @@ def get_function_executions(request, slug: str):
             'arguments': execution.arguments,
             'status_code': execution.status_code,
             'executed_version': execution.executed_version,
+            'cached': execution.cached,
             'error_message': execution.error_message,
             'thread_id': execution.thread.openai_id if execution.thread else None,
             'thread_metadata': execution.thread.metadata if execution.thread else None,
@@ -110,7 +83,7 @@ def get_function_executions(request, slug: str):
     return JsonResponse({"executions": executions_data})
 
 
-@api.get("/list_scripts", auth=BearerAuth())
+@api.get("/list_scripts")
 def list_scripts(request):
     try:
         scripts = CodeInterpreterScript.objects.filter(
@@ -146,7 +119,7 @@ class FunctionCreateSchema(Schema):
     version: int = 1
 
 
-@api.post("/create_function", auth=BearerAuth())
+@api.post("/create_function")
 async def create_function(request, payload: FunctionCreateSchema):
     try:
         project = request.auth['project']
@@ -190,7 +163,7 @@ class FunctionUpdateSchema(Schema):
     assistant_ids: list = None
 
 
-@api.post("/update_function/{function_uuid}", auth=BearerAuth())
+@api.post("/update_function/{function_uuid}")
 async def update_function(request, function_uuid, payload: FunctionUpdateSchema):
     try:
         function = await LocalAPIFunction.objects.aget(uuid=function_uuid, projects=request.auth['project'])
@@ -231,7 +204,7 @@ async def update_function(request, function_uuid, payload: FunctionUpdateSchema)
         return JsonResponse({"error": str(e)}, status=400)
 
 
-@api.delete("/delete_function/{function_uuid}", auth=BearerAuth())
+@api.delete("/delete_function/{function_uuid}")
 async def delete_function(request, function_uuid):
     try:
         function = await LocalAPIFunction.objects.aget(uuid=function_uuid, projects=request.auth['project'])
@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.core.cache import caches
+from ..main.cache import TTLCache, MISSING
+
+
+class ResultCache:
+    """
+    Caches the results of the functions that opt in with cache_ttl.
+    Results are kept in an in-process LRU, or in the Django cache given by FUNCTION_CACHE_ALIAS.
+    """
+
+    def __init__(self, maxsize=1024, alias=None):
+        self.alias = alias
+        self.local = None if alias else TTLCache(maxsize=maxsize)
+        self.hits = 0
+        self.misses = 0
+
+    async def aget(self, key):
+        if self.local is not None:
+            value = self.local.get(key, MISSING)
+        else:
+            value = await caches[self.alias].aget(self._key(key), MISSING)
+
+        if value is MISSING:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def aset(self, key, value, ttl):
+        if self.local is not None:
+            self.local.set(key, value, ttl=ttl)
+        else:
+            await caches[self.alias].aset(self._key(key), value, ttl)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'backend': self.alias or 'memory',
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / total if total else 0.0,
+            'size': len(self.local) if self.local is not None else None,
+        }
+
+    @staticmethod
+    def _key(key):
+        return f"oa:function_result:{key}"
+
+
+result_cache = ResultCache(
+    maxsize=settings.FUNCTION_CACHE_SIZE,
+    alias=settings.FUNCTION_CACHE_ALIAS,
+)
@@ -0,0 +1,91 @@
+import asyncio
+import atexit
+import logging
+import threading
+from collections import deque
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from .models import FunctionExecution
+
+
+logger = logging.getLogger(__name__)
+
+
+class ExecutionLogger:
+    """
+    Buffers the FunctionExecution records and writes them in batches from a background task,
+    so that logging doesn't add a DB write to the tool call turnaround.
+
+    The buffer is flushed when it reaches `batch_size` records or every `flush_interval` seconds,
+    and on shutdown. Records arriving while the buffer is full are dropped and counted.
+    """
+
+    def __init__(self, batch_size=100, flush_interval=1.0, max_buffer=10000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.dropped = 0
+        self._buffer = deque()
+        self._lock = threading.Lock()
+        self._task = None
+        self._wakeup = None
+
+    def log(self, **fields):
+        with self._lock:
+            if len(self._buffer) >= self.max_buffer:
+                self.dropped += 1
+                logger.warning(f"Execution log buffer is full; dropped {self.dropped} records so far.")
+                return
+            self._buffer.append(FunctionExecution(**fields))
+            buffered = len(self._buffer)
+
+        self._start()
+        if buffered >= self.batch_size:
+            self._wakeup.set()
+
+    def flush(self):
+        with self._lock:
+            batch = list(self._buffer)
+            self._buffer.clear()
+
+        if not batch:
+            return
+
+        try:
+            FunctionExecution.objects.bulk_create(batch, batch_size=self.batch_size)
+        except Exception as e:
+            self.dropped += len(batch)
+            logger.error(f"Failed to write {len(batch)} function execution records: {e}")
+
+    def _start(self):
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._wakeup = asyncio.Event()
+            self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        # Runs until the buffer is drained; the next record starts it again
+        while self._buffer:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await sync_to_async(self.flush)()
+
+    def stats(self):
+        return {
+            'buffered': len(self._buffer),
+            'dropped': self.dropped,
+        }
+
+
+execution_logger = ExecutionLogger(
+    batch_size=settings.EXECUTION_LOG_BATCH_SIZE,
+    flush_interval=settings.EXECUTION_LOG_FLUSH_INTERVAL,
+    max_buffer=settings.EXECUTION_LOG_MAX_BUFFER,
+)
+
+# Write whatever is left in the buffer when the process exits
+atexit.register(execution_logger.flush)
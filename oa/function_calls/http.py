@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+import httpx
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+# Methods that are safe to send again after a failure
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+RETRY_STATUS_CODES = {429, 502, 503, 504}
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Stops the requests to a host after `failure_threshold` consecutive failures.
+    After `reset_timeout` seconds a single trial request is let through; the circuit closes again if it succeeds
+    and stays open for another `reset_timeout` if it fails. A trial that doesn't report back, e.g. because it was
+    cancelled, is replaced by another one after `reset_timeout`.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_started_at = None
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow_request(self):
+        if self.opened_at is None:
+            return True
+        now = time.monotonic()
+        if now - self.opened_at < self.reset_timeout:
+            return False
+        if self.trial_started_at is not None and now - self.trial_started_at < self.reset_timeout:
+            # Another trial request is in flight
+            return False
+        self.trial_started_at = now
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_started_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.trial_started_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self.trial_started_at = None
+
+
+class HTTPClientPool:
+    """
+    Keeps a keep-alive httpx client per endpoint host, with retries for the idempotent requests
+    and a circuit breaker per host, so that a slow or failing API doesn't stall the runs.
+
+    The web tools send model chosen URLs through the pool, so only the `max_hosts` most recently used hosts
+    keep a client; the others are closed once their requests had the time to finish.
+    """
+
+    def __init__(self, timeout=10, retries=2, backoff=0.5, max_connections=100, max_keepalive_connections=20,
+                 failure_threshold=5, reset_timeout=30, max_hosts=64):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+        )
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_hosts = max_hosts
+        self._clients = OrderedDict()  # host -> (loop, client), least recently used first
+        self._breakers = OrderedDict()  # host -> CircuitBreaker, least recently used first
+        self._lock = threading.Lock()
+
+    def get_client(self, url):
+        host = self._get_host(url)
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            entry = self._clients.get(host)
+            # httpx connections are bound to the event loop they were opened in
+            if entry is None or entry[0] is not loop:
+                if entry is not None:
+                    self._close(*entry)
+                client = httpx.AsyncClient(http2=True, limits=self.limits, timeout=self.timeout)
+                self._clients[host] = entry = (loop, client)
+            self._clients.move_to_end(host)
+            while len(self._clients) > self.max_hosts:
+                _, evicted = self._clients.popitem(last=False)
+                self._close(*evicted)
+            return entry[1]
+
+    def get_breaker(self, url):
+        host = self._get_host(url)
+        with self._lock:
+            if host not in self._breakers:
+                self._breakers[host] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            self._breakers.move_to_end(host)
+            while len(self._breakers) > self.max_hosts:
+                self._breakers.popitem(last=False)
+            return self._breakers[host]
+
+    def _close(self, loop, client):
+        # The requests still using the client are given their timeout to finish
+        if loop.is_closed():
+            return
+        try:
+            loop.call_soon_threadsafe(loop.call_later, self.timeout, lambda: loop.create_task(client.aclose()))
+        except RuntimeError:
+            pass  # The loop was closed in the meantime
+
+    async def request(self, method, url, retries=None, **kwargs):
+        """
+        Sends the request through the pooled client of the host.
+        Raises CircuitOpenError without sending it if the host keeps failing.
+        """
+        breaker = self.get_breaker(url)
+        if not breaker.allow_request():
+            raise CircuitOpenError(f"Requests to {self._get_host(url)} are suspended after repeated failures.")
+
+        client = self.get_client(url)
+        retries = self.retries if retries is None else retries
+        attempts = retries + 1 if method.upper() in IDEMPOTENT_METHODS else 1
+
+        for attempt in range(attempts):
+            is_last = attempt == attempts - 1
+            try:
+                response = await client.request(method, url, **kwargs)
+            except httpx.TransportError:
+                if is_last:
+                    breaker.record_failure()
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUS_CODES:
+                    breaker.record_success()
+                    return response
+                if is_last:
+                    breaker.record_failure()
+                    return response
+
+            # Exponential backoff before the next attempt
+            await asyncio.sleep(self.backoff * 2 ** attempt)
+
+    @staticmethod
+    def _get_host(url):
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}"
+
+
+http_pool = HTTPClientPool(
+    timeout=settings.EXTERNAL_API_TIMEOUT,
+    retries=settings.EXTERNAL_API_RETRIES,
+    backoff=settings.EXTERNAL_API_BACKOFF,
+    max_connections=settings.EXTERNAL_API_MAX_CONNECTIONS,
+    failure_threshold=settings.EXTERNAL_API_FAILURE_THRESHOLD,
+    reset_timeout=settings.EXTERNAL_API_RESET_TIMEOUT,
+    max_hosts=settings.EXTERNAL_API_MAX_HOSTS,
+)
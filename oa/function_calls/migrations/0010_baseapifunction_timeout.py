@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-17 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('function_calls', '0009_alter_baseapifunction_slug'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='baseapifunction',
+            name='timeout',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
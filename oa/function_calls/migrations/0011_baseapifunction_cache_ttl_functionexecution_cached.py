@@ -0,0 +1,23 @@
+# Generated by Django 5.1.2 on 2026-10-17 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('function_calls', '0010_baseapifunction_timeout'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='baseapifunction',
+            name='cache_ttl',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='functionexecution',
+            name='cached',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -1,9 +1,18 @@
+import hashlib
+import json
 import uuid
+from urllib.parse import urlsplit
 import httpx
+from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.db import models
 from django.http import JsonResponse
 from django.utils.text import slugify
+from ..main.cache import MISSING
 from ..main.models import Project, Thread
+from .cache import result_cache
+from .http import http_pool
+from .sandbox import function_runner, compile_code
 
 
 class CodeInterpreterScript(models.Model):
@@ -39,6 +48,13 @@ class BaseAPIFunction(models.Model):
 
     assistant_ids = models.JSONField(default=list, blank=True)
 
+    # Maximum execution time in seconds when called by a run; defaults to the TOOL_CALL_TIMEOUT setting
+    timeout = models.PositiveIntegerField(blank=True, null=True)
+
+    # Seconds to reuse the result of a call with the same arguments; blank => results are not cached.
+    # Only for functions whose result depends on the arguments alone, e.g. lookups
+    cache_ttl = models.PositiveIntegerField(blank=True, null=True)
+
     def __str__(self):
         return self.name
 
@@ -57,6 +73,31 @@ class BaseAPIFunction(models.Model):
             "strict": strict,
         }
 
+    def get_result_cache_key(self, arguments):
+        # Arguments are canonicalized so that the key doesn't depend on their order
+        canonical = json.dumps(arguments, sort_keys=True, separators=(',', ':'), default=str)
+        digest = hashlib.sha256(canonical.encode()).hexdigest()
+        modified_at = self.modified_at.isoformat() if self.modified_at else ''
+        return f"{self.slug}:{getattr(self, 'version', '')}:{modified_at}:{digest}"
+
+    async def execute_cached(self, **kwargs):
+        """
+        Executes the function, reusing the result of an earlier call with the same arguments if cache_ttl is set.
+        Returns the result and whether it came from the cache.
+        """
+        if not self.cache_ttl:
+            return await self.execute(**kwargs), False
+
+        key = self.get_result_cache_key(kwargs)
+        result = await result_cache.aget(key)
+        if result is not MISSING:
+            return result, True
+
+        result = await self.execute(**kwargs)
+        if not (isinstance(result, dict) and 'error' in result):
+            await result_cache.aset(key, result, self.cache_ttl)
+        return result, False
+
 
 class LocalAPIFunction(BaseAPIFunction):
     """
@@ -76,30 +117,36 @@ class LocalAPIFunction(BaseAPIFunction):
     # Metadata
     version = models.PositiveIntegerField(default=1)
 
-    async def execute(self, **kwargs):
-        """
-        Executes the stored Python code with the provided **kwargs and returns the final result variable.
-        """
-        # Use a single environment for both globals and locals.
-        env = {}
-        env.update(self.extra_context)
-        env['kwargs'] = kwargs
+    def clean(self):
+        super().clean()
+        self.validate_code()
 
-        # Execute the stored code.
-        try:
-            exec(self.code, env)
-        except Exception as e:
-            # Return an error dictionary instead of a JsonResponse.
-            return {"error": str(e)}
+    def save(self, *args, **kwargs):
+        # Report syntax errors when the function is saved rather than when an assistant calls it
+        self.validate_code()
+        super().save(*args, **kwargs)
 
-        # TODO: Apply result_template and return rendered result
+    def validate_code(self):
+        try:
+            compile_code(self.code)
+        except SyntaxError as e:
+            raise ValidationError({'code': f"Syntax error on line {e.lineno}: {e.msg}"})
 
-        # Check that the code has set a "result" variable.
-        if "result" not in env:
-            return {"error": "No result returned from function code."}
+    def get_code_cache_key(self):
+        # Saving the function changes modified_at, so the compiled code of older versions is never reused
+        return f"{self.uuid}:{self.version}:{self.modified_at.isoformat() if self.modified_at else ''}"
 
-        # Return the plain result dictionary.
-        return env["result"]
+    async def execute(self, **kwargs):
+        """
+        Executes the stored Python code with the provided **kwargs in a worker process and returns the final result variable.
+        """
+        return await function_runner.run(
+            self.code,
+            self.extra_context,
+            kwargs,
+            timeout=self.timeout or settings.TOOL_CALL_TIMEOUT,
+            cache_key=self.get_code_cache_key(),
+        )
 
 
 class ExternalAPIFunction(BaseAPIFunction):
@@ -123,29 +170,32 @@ class ExternalAPIFunction(BaseAPIFunction):
         url = kwargs.pop('url', self.endpoint)
         if not url:
             raise ValueError("No endpoint URL provided.")
+        if url != self.endpoint and not self.is_same_origin(url):
+            # The arguments come from the model, so they must not send the bearer token to another host
+            raise ValueError("The URL must be on the host of the function endpoint.")
 
-        async with httpx.AsyncClient() as client:
-            try:
-                if self.method == 'GET':
-                    response = await client.get(url, headers=headers, params=kwargs)
-                else:  # POST, PUT, DELETE
-                    response = await client.request(
-                        method=self.method,
-                        url=self.endpoint,
-                        headers=headers,
-                        json=kwargs,
-                    )
+        timeout = self.timeout or settings.EXTERNAL_API_TIMEOUT
+        try:
+            if self.method == 'GET':
+                response = await http_pool.request('GET', url, headers=headers, params=kwargs, timeout=timeout)
+            else:  # POST, PUT, DELETE
+                response = await http_pool.request(self.method, url, headers=headers, json=kwargs, timeout=timeout)
+        except httpx.RequestError as e:
+            raise RuntimeError(f"Request failed: {e}")
 
-                response.raise_for_status()  # Raise an error for HTTP error responses
+        response.raise_for_status()  # Raise an error for HTTP error responses
 
-                # Handle non-JSON content (e.g., images, HTML)
-                if 'application/json' in response.headers.get('Content-Type', ''):
-                    return response.json()
+        # Handle non-JSON content (e.g., images, HTML)
+        if 'application/json' in response.headers.get('Content-Type', ''):
+            return response.json()
 
-                return response.content
+        return response.content
 
-            except httpx.RequestError as e:
-                raise RuntimeError(f"Request failed: {e}")
+    def is_same_origin(self, url):
+        if not self.endpoint:
+            return False
+        endpoint, target = urlsplit(self.endpoint), urlsplit(url)
+        return (endpoint.scheme.lower(), endpoint.netloc.lower()) == (target.scheme.lower(), target.netloc.lower())
 
 
 class FunctionExecution(models.Model):
@@ -163,6 +213,9 @@ class FunctionExecution(models.Model):
 
     executed_version = models.PositiveIntegerField(null=True, blank=True)
 
+    # Whether the result was served from the function's result cache
+    cached = models.BooleanField(default=False)
+
     time = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
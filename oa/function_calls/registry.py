@@ -0,0 +1,76 @@
+import logging
+
+from django.conf import settings
+from django.db.models import Count, Max
+from ..main.cache import TTLCache
+from .models import BaseAPIFunction, LocalAPIFunction, ExternalAPIFunction
+
+
+logger = logging.getLogger(__name__)
+
+
+class ToolFunction:
+    """
+    Runs the oa.tools implementations with the same interface as the API functions.
+    The tool class is looked up on execution, so the module of the tool is imported only when it is used.
+    """
+    timeout = None
+
+    def __init__(self, name, implementations):
+        self.name = name
+        self.slug = name
+        self.implementations = implementations
+
+    def __str__(self):
+        return self.name
+
+    async def execute(self, **kwargs):
+        tool_class = self.implementations[self.name]
+        return await tool_class(**kwargs).aexecute()
+
+    async def execute_cached(self, **kwargs):
+        return await self.execute(**kwargs), False
+
+
+def get_tool_functions():
+    try:
+        from ..tools import FUNCTION_IMPLEMENTATIONS
+    except ImportError as e:
+        # The tools have optional dependencies
+        logger.warning(f"Built-in tools are not available: {e}")
+        return {}
+    return {name: ToolFunction(name, FUNCTION_IMPLEMENTATIONS) for name in FUNCTION_IMPLEMENTATIONS}
+
+
+async def build_function_registry(project, assistant_id):
+    functions = get_tool_functions()
+
+    # Project functions override the built-in tools with the same name
+    for model in (ExternalAPIFunction, LocalAPIFunction):
+        async for function in model.objects.filter(projects=project):
+            # Functions that are not assigned to any assistant are available to all of them
+            if not function.assistant_ids or assistant_id in function.assistant_ids:
+                functions[function.slug] = function
+
+    return functions
+
+
+registry_cache = TTLCache(maxsize=settings.FUNCTION_REGISTRY_SIZE, ttl=settings.FUNCTION_REGISTRY_TTL)
+
+
+async def get_function_registry(project, assistant_id):
+    """
+    Returns the mapping of function names to the executable functions of the project's assistant.
+    Registries are cached per process. They are keyed on the number of functions of the project and their last
+    modification, so that a function saved or deleted by any process is seen by the next lookup.
+    """
+    version = await BaseAPIFunction.objects.filter(projects=project).aaggregate(
+        count=Count('pk'), modified_at=Max('modified_at')
+    )
+    key = (project.pk, assistant_id, version['count'], version['modified_at'])
+
+    functions = registry_cache.get(key)
+    if functions is None:
+        functions = await build_function_registry(project, assistant_id)
+        registry_cache.set(key, functions)
+    return functions
@@ -0,0 +1,267 @@
+import asyncio
+import json
+import math
+import multiprocessing
+import signal
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import resource
+except ImportError:  # Not available on Windows; the code runs without CPU and memory limits
+    resource = None
+
+from django.conf import settings
+
+
+class CPUTimeExceeded(Exception):
+    pass
+
+
+def compile_code(code, filename="<function>"):
+    """Compiles the function code; raises SyntaxError if it is not valid."""
+    return compile(code, filename, "exec")
+
+
+# Worker side
+
+# Code objects of the functions executed by the worker, keyed by function version
+_code_cache = OrderedDict()
+_code_cache_size = 0
+
+
+def _raise_cpu_time_exceeded(signum, frame):
+    raise CPUTimeExceeded("CPU time limit exceeded.")
+
+
+def _init_worker(memory_limit, code_cache_size):
+    global _code_cache_size
+    _code_cache_size = code_cache_size
+
+    if resource is None:
+        return
+    if memory_limit:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    # Raised when the soft CPU limit set by _run_code is exceeded, instead of killing the worker
+    signal.signal(signal.SIGXCPU, _raise_cpu_time_exceeded)
+
+
+def _set_cpu_limit(seconds):
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    if seconds is None:
+        resource.setrlimit(resource.RLIMIT_CPU, (hard, hard))
+        return
+    # The limit applies to the total CPU time of the worker, so it is set relative to the time used so far
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    soft = math.ceil(usage.ru_utime + usage.ru_stime + seconds)
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _get_code_object(code, cache_key):
+    if cache_key is None or not _code_cache_size:
+        return compile_code(code)
+
+    code_object = _code_cache.get(cache_key)
+    if code_object is None:
+        code_object = _code_cache[cache_key] = compile_code(code)
+        while len(_code_cache) > _code_cache_size:
+            _code_cache.popitem(last=False)
+    else:
+        _code_cache.move_to_end(cache_key)
+    return code_object
+
+
+def _run_code(code, context, kwargs, cpu_limit, cache_key=None):
+    """
+    Executes the code in the worker and returns the JSON encoded value of its "result" variable
+    """
+    env = dict(context)
+    env['kwargs'] = kwargs
+
+    if resource is not None and cpu_limit:
+        _set_cpu_limit(cpu_limit)
+    try:
+        exec(_get_code_object(code, cache_key), env)
+    except Exception as e:
+        # e.g. MemoryError has no message
+        return json.dumps({"error": str(e) or e.__class__.__name__})
+    finally:
+        if resource is not None and cpu_limit:
+            _set_cpu_limit(None)
+
+    # TODO: Apply result_template and return rendered result
+
+    if "result" not in env:
+        return json.dumps({"error": "No result returned from function code."})
+
+    return json.dumps(env["result"], default=str)
+
+
+def _worker_main(conn, memory_limit, code_cache_size):
+    """Runs the calls received over the pipe until the runner closes it"""
+    _init_worker(memory_limit, code_cache_size)
+    while True:
+        try:
+            args = conn.recv()
+        except EOFError:
+            return
+        conn.send(_run_code(*args))
+
+
+# Event loop side
+
+class Worker:
+    """A worker process and the pipe to send it calls"""
+
+    def __init__(self, context, memory_limit, code_cache_size):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main,
+            args=(child_conn, memory_limit, code_cache_size),
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+
+    def call(self, args, timeout):
+        """Sends the call and waits for its result; raises TimeoutError if it doesn't come in time."""
+        self.conn.send(args)
+        if not self.conn.poll(timeout):
+            raise TimeoutError(f"Function execution exceeded {timeout} seconds.")
+        return self.conn.recv()
+
+    def kill(self):
+        self.process.kill()
+        self.conn.close()
+        self.process.join()
+
+
+class FunctionRunner:
+    """
+    Executes function code in a warm pool of worker processes, so that slow or CPU heavy functions don't block
+    the event loop and the other streams served by the process.
+
+    Each call is limited in wall time and CPU time; the workers are limited in memory.
+    A call that uses more than `cpu_limit` seconds of CPU returns an error and leaves its worker running; the limit
+    only applies to the calls whose timeout is longer, and has a granularity of a second.
+    Every call has a worker to itself, so a call that exceeds its wall time is stopped by killing its own worker
+    only, and a replacement is started in the background. Calls beyond `max_workers` wait for a free worker.
+    A call whose caller is cancelled runs on until it is done or times out, and its result is discarded.
+    """
+
+    def __init__(self, max_workers=4, memory_limit=None, code_cache_size=256, cpu_limit=None):
+        self.max_workers = max_workers
+        self.memory_limit = memory_limit
+        self.cpu_limit = cpu_limit
+        self.code_cache_size = code_cache_size
+        self._context = multiprocessing.get_context('spawn')
+        self._idle = []
+        self._count = 0  # workers started and not killed
+        self._dispatcher = None
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)  # notified when a worker is idle or can be started
+
+    def get_dispatcher(self):
+        # Each dispatcher thread waits on one worker, so the threads bound the number of concurrent calls
+        with self._lock:
+            if self._dispatcher is None:
+                self._dispatcher = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix='function-runner',
+                )
+                # Start all the workers now rather than on demand
+                for _ in range(self.max_workers - self._count):
+                    self._count += 1
+                    threading.Thread(target=self._start_idle_worker, daemon=True).start()
+            return self._dispatcher
+
+    def _start_worker(self):
+        return Worker(self._context, self.memory_limit, self.code_cache_size)
+
+    def _start_counted_worker(self):
+        # The worker is already counted; the count is given back if it can't be started
+        try:
+            return self._start_worker()
+        except Exception:
+            with self._available:
+                self._count -= 1
+                self._available.notify()
+            raise
+
+    def _start_idle_worker(self):
+        worker = self._start_counted_worker()
+        self._checkin(worker)
+
+    def _checkin(self, worker):
+        with self._available:
+            self._idle.append(worker)
+            self._available.notify()
+
+    def _checkout(self):
+        with self._available:
+            while True:
+                while self._idle:
+                    worker = self._idle.pop()
+                    if worker.process.is_alive():
+                        return worker
+                    self._count -= 1
+                if self._count < self.max_workers:
+                    self._count += 1
+                    break
+                # All the workers are being started
+                self._available.wait()
+        return self._start_counted_worker()
+
+    def _discard(self, worker):
+        worker.kill()
+        # A replacement is started in the background, so that the next call finds a warm worker
+        threading.Thread(target=self._start_idle_worker, daemon=True).start()
+
+    def _call(self, args, timeout):
+        worker = self._checkout()
+        try:
+            result = worker.call(args, timeout)
+        except TimeoutError:
+            self._discard(worker)
+            raise
+        except (EOFError, OSError):
+            # The worker died, e.g. by going over the memory limit
+            self._discard(worker)
+            return json.dumps({"error": "Function execution failed; the worker process has died."})
+
+        self._checkin(worker)
+        return result
+
+    async def run(self, code, context, kwargs, timeout, cache_key=None):
+        """
+        Runs the code with the given kwargs; when a cache_key is given, the workers reuse the compiled code
+        of earlier calls with the same key. Raises TimeoutError when the call exceeds its wall time.
+        """
+        # A CPU limit at or above the timeout would never be reached before the wall time limit
+        cpu_limit = self.cpu_limit if self.cpu_limit and self.cpu_limit < timeout else None
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(
+            self.get_dispatcher(), self._call, (code, context, kwargs, cpu_limit, cache_key), timeout
+        )
+        return json.loads(result)
+
+    def close(self):
+        with self._lock:
+            dispatcher, self._dispatcher = self._dispatcher, None
+            workers, self._idle = self._idle, []
+            self._count -= len(workers)
+        if dispatcher is not None:
+            dispatcher.shutdown(wait=True, cancel_futures=True)
+        for worker in workers:
+            worker.kill()
+
+
+function_runner = FunctionRunner(
+    max_workers=settings.FUNCTION_WORKERS,
+    memory_limit=settings.FUNCTION_MEMORY_LIMIT,
+    code_cache_size=settings.FUNCTION_CODE_CACHE_SIZE,
+    cpu_limit=settings.FUNCTION_CPU_LIMIT,
+)
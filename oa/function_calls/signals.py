@@ -0,0 +1,18 @@
+from django.db.models.signals import m2m_changed
+from django.dispatch import receiver
+from django.utils import timezone
+from .models import BaseAPIFunction
+
+
+@receiver(m2m_changed, sender=BaseAPIFunction.projects.through)
+def touch_functions(sender, instance, action, reverse, pk_set, **kwargs):
+    # The function registries are keyed on the modification time of the functions, which
+    # changing their projects doesn't update
+    if not action.startswith('post_'):
+        return
+    functions = BaseAPIFunction.objects.all()
+    if not reverse:
+        functions = functions.filter(pk=instance.pk)
+    elif pk_set:
+        functions = functions.filter(pk__in=pk_set)
+    functions.update(modified_at=timezone.now())
@@ -1,3 +1,284 @@
-from django.test import TestCase
+import asyncio
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from ..main.models import Project
+from . import sandbox
+from .http import CircuitOpenError, HTTPClientPool
+from .models import ExternalAPIFunction, LocalAPIFunction
+from .registry import get_function_registry
+from .sandbox import FunctionRunner
+
+
+SLEEP_CODE = "import time\ntime.sleep(kwargs['seconds'])\nresult = kwargs['seconds']"
+BUSY_CODE = "import time\nend = time.time() + kwargs['seconds']\nwhile time.time() < end:\n    pass\nresult = 'done'"
+
+
+class FunctionRunnerTests(SimpleTestCase):
+    def setUp(self):
+        self.runner = FunctionRunner(max_workers=2, memory_limit=None, code_cache_size=8)
+
+    def tearDown(self):
+        self.runner.close()
+
+    async def test_other_streams_keep_flowing_while_a_slow_function_runs(self):
+        ticks = 0
+
+        async def stream():
+            # Stands for an SSE stream relaying events every 10 ms
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(.01)
+                ticks += 1
+
+        ticker = asyncio.create_task(stream())
+        started_at = time.monotonic()
+        try:
+            result = await self.runner.run(BUSY_CODE, {}, {'seconds': 1}, timeout=10)
+        finally:
+            ticker.cancel()
+        elapsed = time.monotonic() - started_at
+
+        self.assertEqual(result, 'done')
+        # The loop would be frozen for the whole second if the code ran on it
+        self.assertGreater(ticks, elapsed / .01 * .5)
+
+    async def test_timeout_stops_only_its_own_call(self):
+        slow = asyncio.create_task(self.runner.run(SLEEP_CODE, {}, {'seconds': 2}, timeout=10))
+        with self.assertRaises(TimeoutError):
+            await self.runner.run(SLEEP_CODE, {}, {'seconds': 30}, timeout=.5)
+        self.assertEqual(await slow, 2)
+
+    async def test_cancelled_call_leaves_other_calls_running(self):
+        slow = asyncio.create_task(self.runner.run(SLEEP_CODE, {}, {'seconds': 1}, timeout=10))
+        cancelled = asyncio.create_task(self.runner.run(SLEEP_CODE, {}, {'seconds': 1}, timeout=10))
+        await asyncio.sleep(.2)
+        cancelled.cancel()
+        self.assertEqual(await slow, 1)
+
+    async def test_cpu_limit_below_the_timeout_returns_an_error(self):
+        runner = FunctionRunner(max_workers=1, memory_limit=None, cpu_limit=1)
+        self.addCleanup(runner.close)
+        await runner.run(SLEEP_CODE, {}, {'seconds': 0}, timeout=10)
+        [worker] = runner._idle
+
+        started_at = time.monotonic()
+        result = await runner.run("while True:\n    pass", {}, {}, timeout=10)
+        self.assertEqual(result, {'error': 'CPU time limit exceeded.'})
+        self.assertLess(time.monotonic() - started_at, 5)
+        # The worker stays in the pool
+        self.assertEqual(await runner.run(SLEEP_CODE, {}, {'seconds': 0}, timeout=10), 0)
+        self.assertEqual(runner._idle, [worker])
+
+    async def test_worker_is_replaced_after_a_timeout(self):
+        with self.assertRaises(TimeoutError):
+            await self.runner.run(SLEEP_CODE, {}, {'seconds': 30}, timeout=.5)
+        results = await asyncio.gather(*[
+            self.runner.run(SLEEP_CODE, {}, {'seconds': .1}, timeout=10) for _ in range(4)
+        ])
+        self.assertEqual(results, [.1] * 4)
+
+
+class CodeCacheTests(SimpleTestCase):
+    # A function of a realistic size: a few hundred lines of helpers and a short entry point
+    code = "\n".join(
+        f"def helper_{index}(value):\n    return {{'index': {index}, 'value': value * {index}}}\n"
+        for index in range(200)
+    ) + "\nresult = helper_199(kwargs['value'])\n"
+    calls = 200
+
+    def run_calls(self, cache_key):
+        started_at = time.perf_counter()
+        for _ in range(self.calls):
+            result = sandbox._run_code(self.code, {}, {'value': 2}, None, cache_key)
+        self.assertEqual(result, '{"index": 199, "value": 398}')
+        return (time.perf_counter() - started_at) / self.calls
+
+    def test_cached_code_is_faster_than_recompiling(self):
+        # Benchmark of the repeated calls of a function in a worker, with and without the code cache
+        with mock.patch.object(sandbox, '_code_cache', sandbox.OrderedDict()), \
+                mock.patch.object(sandbox, '_code_cache_size', 8):
+            recompiled = self.run_calls(cache_key=None)
+            cached = self.run_calls(cache_key='function:1')
+            self.assertEqual(list(sandbox._code_cache), ['function:1'])
+        self.assertLess(cached, recompiled / 2)
+
+
+class ExternalAPIFunctionTests(SimpleTestCase):
+    def setUp(self):
+        self.function = ExternalAPIFunction(endpoint='https://api.example.com/v1/items', bearer_token='secret')
+
+    def test_url_override_must_stay_on_the_endpoint_host(self):
+        self.assertTrue(self.function.is_same_origin('https://API.example.com/v1/items/1'))
+        self.assertFalse(self.function.is_same_origin('https://evil.example.net/collect'))
+        self.assertFalse(self.function.is_same_origin('http://api.example.com/v1/items'))
+
+    async def test_url_override_to_another_host_is_rejected(self):
+        with self.assertRaises(ValueError):
+            await self.function.execute(url='https://evil.example.net/collect', q='x')
+
+
+class HTTPClientPoolTests(SimpleTestCase):
+    async def test_least_recently_used_clients_are_closed(self):
+        pool = HTTPClientPool(timeout=0, max_hosts=2)
+        first = pool.get_client('https://a.example.com/')
+        pool.get_client('https://b.example.com/')
+        pool.get_client('https://a.example.com/x')
+        pool.get_client('https://c.example.com/')
+        for _ in range(5):
+            await asyncio.sleep(0)
+
+        self.assertEqual(list(pool._clients), ['https://a.example.com', 'https://c.example.com'])
+        self.assertFalse(first.is_closed)
+        self.assertIs(pool.get_client('https://a.example.com/'), first)
+
+        pool.get_client('https://d.example.com/')
+        pool.get_client('https://e.example.com/')
+        for _ in range(5):
+            await asyncio.sleep(0)
+        self.assertTrue(first.is_closed)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Stands for an external API. /flaky fails with a 503 `failures` times before succeeding,
+    /down fails while `down` is set, and /ok always succeeds.
+    """
+    protocol_version = 'HTTP/1.1'  # Keeps the connections alive
+    disable_nagle_algorithm = True  # The headers and the body are written apart
+    requests = Counter()
+    connections = 0
+    failures = 0
+    down = True
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with self.lock:
+            type(self).connections += 1
+
+    def handle_request(self):
+        with self.lock:
+            self.requests[self.command, self.path] += 1
+            if self.path == '/flaky':
+                failing = type(self).failures > 0
+                type(self).failures -= 1
+            else:
+                failing = self.path == '/down' and self.down
+        if self.path == '/slow':
+            time.sleep(.05)
+        self.send_response(503 if failing else 200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    do_GET = do_POST = handle_request
+
+    def log_message(self, format, *args):
+        pass
+
+
+class HTTPClientPoolRequestTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_port}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        StubHandler.requests = Counter()
+        StubHandler.connections = 0
+        StubHandler.failures = 0
+        StubHandler.down = True
+        self.pool = HTTPClientPool(timeout=5, retries=2, backoff=0, failure_threshold=2, reset_timeout=.2)
+
+    async def test_idempotent_requests_are_retried(self):
+        StubHandler.failures = 2
+        response = await self.pool.request('GET', f"{self.base_url}/flaky")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(StubHandler.requests['GET', '/flaky'], 3)
+
+    async def test_other_requests_are_sent_once(self):
+        StubHandler.failures = 2
+        response = await self.pool.request('POST', f"{self.base_url}/flaky")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(StubHandler.requests['POST', '/flaky'], 1)
+
+    async def test_circuit_opens_then_closes_after_a_successful_trial(self):
+        url = f"{self.base_url}/down"
+        for _ in range(2):
+            await self.pool.request('POST', url)
+        with self.assertRaises(CircuitOpenError):
+            await self.pool.request('POST', url)
+        self.assertEqual(StubHandler.requests['POST', '/down'], 2)
+
+        await asyncio.sleep(.25)
+        StubHandler.down = False
+        # Only one of the concurrent requests is let through as the trial
+        results = await asyncio.gather(*[self.pool.request('POST', url) for _ in range(3)], return_exceptions=True)
+        self.assertEqual(sum(isinstance(result, CircuitOpenError) for result in results), 2)
+        self.assertEqual(StubHandler.requests['POST', '/down'], 3)
+
+        response = await self.pool.request('POST', url)
+        self.assertEqual(response.status_code, 200)
+
+    async def test_failed_trial_opens_the_circuit_again(self):
+        url = f"{self.base_url}/down"
+        for _ in range(2):
+            await self.pool.request('POST', url)
+
+        await asyncio.sleep(.25)
+        response = await self.pool.request('POST', url)
+        self.assertEqual(response.status_code, 503)
+        with self.assertRaises(CircuitOpenError):
+            await self.pool.request('POST', url)
+        self.assertEqual(StubHandler.requests['POST', '/down'], 3)
+
+    async def test_concurrent_requests_share_the_pooled_connections(self):
+        # Load test against the stub server: the requests queue for the pool instead of opening more connections
+        pool = HTTPClientPool(timeout=10, max_connections=10, max_keepalive_connections=10)
+        responses = await asyncio.gather(*[pool.request('GET', f"{self.base_url}/slow") for _ in range(100)])
+        self.assertTrue(all(response.status_code == 200 for response in responses))
+        self.assertEqual(StubHandler.requests['GET', '/slow'], 100)
+        self.assertLessEqual(StubHandler.connections, 10)
+
+
+class FunctionRegistryTests(TestCase):
+    def setUp(self):
+        self.project = Project.objects.create(key='sk-test')
+        self.function = LocalAPIFunction.objects.create(name='Lookup', slug='lookup', code="result = 1")
+        self.function.projects.add(self.project)
+
+    def get_registry(self):
+        return async_to_sync(get_function_registry)(self.project, 'asst_1')
+
+    def test_registry_is_cached(self):
+        registry = self.get_registry()
+        self.assertIs(self.get_registry(), registry)
+
+    def test_change_made_by_another_process_is_seen(self):
+        self.assertEqual(self.get_registry()['lookup'].code, "result = 1")
+        # An update without the signals of this process, as done by another worker
+        LocalAPIFunction.objects.filter(pk=self.function.pk).update(code="result = 2", modified_at=timezone.now())
+        self.assertEqual(self.get_registry()['lookup'].code, "result = 2")
+
+    def test_project_changes_are_seen(self):
+        self.assertIn('lookup', self.get_registry())
+        other = LocalAPIFunction.objects.create(name='Search', slug='search', code="result = 1")
+        self.project.baseapifunction_set.add(other)
+        self.assertIn('search', self.get_registry())
+
+        self.function.projects.remove(self.project)
+        self.assertNotIn('lookup', self.get_registry())
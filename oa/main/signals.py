@@ -0,0 +1,20 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Project, SharedLink
+
+
+@receiver(post_save, sender=Project)
+@receiver(post_delete, sender=Project)
+def reset_project_client(sender, instance, **kwargs):
+    # The pooled OpenAI client and the cached project hold the key; drop them so the next request picks up the new one
+    from ..api.auth import auth_cache, project_cache_key
+    from ..api.clients import client_registry
+    client_registry.reset(instance.uuid)
+    auth_cache.invalidate(project_cache_key(instance.uuid))
+
+
+@receiver(post_save, sender=SharedLink)
+@receiver(post_delete, sender=SharedLink)
+def invalidate_shared_link(sender, instance, **kwargs):
+    from ..api.auth import auth_cache, shared_link_cache_key
+    auth_cache.invalidate(shared_link_cache_key(instance.token))
@@ -1,3 +1,24 @@
-from django.test import TestCase
+import json
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.test import TestCase, RequestFactory
+from .views import cache_stats
+
+
+class CacheStatsTests(TestCase):
+    def get_stats(self, user):
+        request = RequestFactory().get('/stats/')
+        request.user = user
+        return cache_stats(request)
+
+    def test_stats_are_shown_to_staff(self):
+        response = self.get_stats(User.objects.create(username='admin', is_staff=True))
+        self.assertEqual(response.status_code, 200)
+        stats = json.loads(response.content)
+        self.assertIn('hit_ratio', stats['auth'])
+        self.assertIn('hit_ratio', stats['file_content'])
+        self.assertIn('dropped', stats['execution_log'])
+
+    def test_stats_are_hidden_from_other_users(self):
+        response = self.get_stats(User.objects.create(username='user'))
+        self.assertEqual(response.status_code, 302)
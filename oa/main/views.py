@@ -5,6 +5,7 @@ from django.contrib.auth import authenticate, login
 from django.contrib import messages
 from django import forms
 from django.http import JsonResponse
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import render, get_object_or_404, redirect
 from django.views.generic import TemplateView
@@ -86,6 +87,35 @@ def analytics(request, project_uuid):
     })
 
 
+@staff_member_required
+def cache_stats(request):
+    """Hit ratios of the caches and the dropped execution logs, as counted by the process serving the request"""
+    from ..api.auth import auth_cache
+    from ..api.files import file_cache
+    from ..api.metadata import metadata_cache
+    from ..api.threads import history_cache
+    from ..function_calls.cache import result_cache
+    from ..function_calls.executions import execution_logger
+    from ..function_calls.registry import registry_cache
+
+    stats = {
+        'auth': auth_cache.stats(),
+        'metadata': metadata_cache.stats(),
+        'thread_history': history_cache.stats(),
+        'file_content': file_cache.stats(),
+        'function_results': result_cache.stats(),
+        'function_registry': registry_cache.stats(),
+        'execution_log': execution_logger.stats(),
+    }
+    try:
+        from ..tools.web import page_cache
+        stats['web_pages'] = page_cache.stats()
+    except ImportError:
+        pass  # The web tools have optional dependencies
+
+    return JsonResponse(stats)
+
+
 # Threads
 
 @login_required
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 from django.utils.text import slugify
 from dotenv import load_dotenv
@@ -261,3 +262,85 @@ LOGOUT_REDIRECT_URL = '/'
 SESSION_COOKIE_AGE = 315360000  # 10 years
 SESSION_EXPIRE_AT_BROWSER_CLOSE = False
 
+
+
+# OpenAI clients are pooled per project and reused across requests
+OPENAI_MAX_CLIENTS = int(os.getenv('OPENAI_MAX_CLIENTS', 100))
+OPENAI_CLIENT_IDLE_TIMEOUT = int(os.getenv('OPENAI_CLIENT_IDLE_TIMEOUT', 600))  # seconds
+OPENAI_CLIENT_CLOSE_DELAY = int(os.getenv('OPENAI_CLIENT_CLOSE_DELAY', 600))  # seconds before a dropped client is closed
+OPENAI_MAX_CONNECTIONS = int(os.getenv('OPENAI_MAX_CONNECTIONS', 100))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('OPENAI_MAX_KEEPALIVE_CONNECTIONS', 20))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv('OPENAI_KEEPALIVE_EXPIRY', 60))  # seconds
+OPENAI_HTTP2 = os.getenv('OPENAI_HTTP2', 'true').lower() == 'true'
+
+# Projects resolved from API tokens are cached in-process and optionally in a shared Django cache
+AUTH_CACHE_SIZE = int(os.getenv('AUTH_CACHE_SIZE', 1024))
+AUTH_CACHE_TTL = int(os.getenv('AUTH_CACHE_TTL', 60))  # seconds
+# In-process entries aren't invalidated by the other workers, so this is the delay before a revocation applies to them
+AUTH_CACHE_LOCAL_TTL = int(os.getenv('AUTH_CACHE_LOCAL_TTL', 5))  # seconds
+AUTH_CACHE_ALIAS = os.getenv('AUTH_CACHE_ALIAS')  # e.g. "default"; unset to use the in-process cache only
+
+# Maximum number of events buffered for a response stream before the run waits for the client
+STREAM_QUEUE_SIZE = int(os.getenv('STREAM_QUEUE_SIZE', 256))
+
+# Number of text_delta events between the full snapshots sent in the delta streaming mode
+STREAM_SNAPSHOT_INTERVAL = int(os.getenv('STREAM_SNAPSHOT_INTERVAL', 50))
+
+# Size of the chunks used when streaming OpenAI file contents to the client
+FILE_STREAM_CHUNK_SIZE = int(os.getenv('FILE_STREAM_CHUNK_SIZE', 64 * 1024))
+
+# Files of a bulk upload are sent to OpenAI concurrently, at most FILE_UPLOAD_CONCURRENCY at a time
+FILE_UPLOAD_CONCURRENCY = int(os.getenv('FILE_UPLOAD_CONCURRENCY', 4))
+
+# Tool calls of a run are executed concurrently, at most TOOL_CALL_CONCURRENCY at a time
+TOOL_CALL_CONCURRENCY = int(os.getenv('TOOL_CALL_CONCURRENCY', 8))
+TOOL_CALL_TIMEOUT = int(os.getenv('TOOL_CALL_TIMEOUT', 30))  # seconds, unless set on the function
+
+# Local functions are executed in a pool of worker processes
+FUNCTION_WORKERS = int(os.getenv('FUNCTION_WORKERS', 4))
+FUNCTION_MEMORY_LIMIT = int(os.getenv('FUNCTION_MEMORY_LIMIT', 512 * 1024 * 1024))  # bytes per worker
+FUNCTION_CODE_CACHE_SIZE = int(os.getenv('FUNCTION_CODE_CACHE_SIZE', 256))  # compiled functions kept per worker
+FUNCTION_CPU_LIMIT = int(os.getenv('FUNCTION_CPU_LIMIT', 10))  # CPU seconds per call, if below its timeout
+
+# Function executions are logged in batches by a background task
+EXECUTION_LOG_BATCH_SIZE = int(os.getenv('EXECUTION_LOG_BATCH_SIZE', 100))
+EXECUTION_LOG_FLUSH_INTERVAL = float(os.getenv('EXECUTION_LOG_FLUSH_INTERVAL', 1))  # seconds
+EXECUTION_LOG_MAX_BUFFER = int(os.getenv('EXECUTION_LOG_MAX_BUFFER', 10000))
+
+# External API functions share a keep-alive client per host
+EXTERNAL_API_TIMEOUT = float(os.getenv('EXTERNAL_API_TIMEOUT', 10))  # seconds, unless set on the function
+EXTERNAL_API_RETRIES = int(os.getenv('EXTERNAL_API_RETRIES', 2))  # for the idempotent methods only
+EXTERNAL_API_BACKOFF = float(os.getenv('EXTERNAL_API_BACKOFF', 0.5))  # seconds, doubled on each retry
+EXTERNAL_API_MAX_CONNECTIONS = int(os.getenv('EXTERNAL_API_MAX_CONNECTIONS', 100))
+EXTERNAL_API_FAILURE_THRESHOLD = int(os.getenv('EXTERNAL_API_FAILURE_THRESHOLD', 5))  # failures to open the circuit
+EXTERNAL_API_RESET_TIMEOUT = float(os.getenv('EXTERNAL_API_RESET_TIMEOUT', 30))  # seconds before a trial request
+EXTERNAL_API_MAX_HOSTS = int(os.getenv('EXTERNAL_API_MAX_HOSTS', 64))  # hosts keeping a client, most recent first
+
+# Results of the functions with a cache_ttl are cached in-process or in the given Django cache
+FUNCTION_CACHE_SIZE = int(os.getenv('FUNCTION_CACHE_SIZE', 1024))
+FUNCTION_CACHE_ALIAS = os.getenv('FUNCTION_CACHE_ALIAS')  # e.g. "default"; unset for the in-process LRU
+
+# Functions available to the assistants are resolved once per run from a per-process registry cache
+FUNCTION_REGISTRY_SIZE = int(os.getenv('FUNCTION_REGISTRY_SIZE', 256))
+FUNCTION_REGISTRY_TTL = int(os.getenv('FUNCTION_REGISTRY_TTL', 300))  # seconds
+
+# Metadata of the files and assistants referenced in threads is cached per process
+METADATA_CACHE_SIZE = int(os.getenv('METADATA_CACHE_SIZE', 4096))
+METADATA_CACHE_TTL = int(os.getenv('METADATA_CACHE_TTL', 300))  # seconds
+METADATA_CONCURRENCY = int(os.getenv('METADATA_CONCURRENCY', 8))  # concurrent lookups per event loop
+
+# Rendered thread histories are cached in-process or in the given Django cache,
+# and only the messages after the last cached one are fetched again
+THREAD_HISTORY_CACHE_SIZE = int(os.getenv('THREAD_HISTORY_CACHE_SIZE', 256))
+THREAD_HISTORY_CACHE_TTL = int(os.getenv('THREAD_HISTORY_CACHE_TTL', 3600))  # seconds
+THREAD_HISTORY_CACHE_ALIAS = os.getenv('THREAD_HISTORY_CACHE_ALIAS')  # e.g. "default"; unset for the in-process LRU
+
+# Vector store syncs remove files concurrently and add them in file batches
+VECTOR_STORE_SYNC_CONCURRENCY = int(os.getenv('VECTOR_STORE_SYNC_CONCURRENCY', 10))
+VECTOR_STORE_BATCH_SIZE = int(os.getenv('VECTOR_STORE_BATCH_SIZE', 500))  # max file_ids per batch in the API
+
+# Contents of the OpenAI files (images, downloads) are cached on the local disk,
+# or in the Django storage with the given alias (e.g. "default"). Set FILE_CACHE_MAX_BYTES to 0 to disable.
+FILE_CACHE_DIR = os.getenv('FILE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'oa-file-cache'))
+FILE_CACHE_STORAGE = os.getenv('FILE_CACHE_STORAGE')
+FILE_CACHE_MAX_BYTES = int(os.getenv('FILE_CACHE_MAX_BYTES', 1024 ** 3))
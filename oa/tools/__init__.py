@@ -1,28 +1,41 @@
 import importlib
-import inspect
-from .config import INSTALLED_TOOLS
+from collections.abc import Mapping
+from functools import cache
+from .config import INSTALLED_TOOLS, TOOL_DEFINITIONS_CACHE
+from .definitions import load_definitions
 
 
-FUNCTION_DEFINITIONS = []
-FUNCTION_IMPLEMENTATIONS = {}
+# FUNCTION_DEFINITIONS and FUNCTION_IMPLEMENTATIONS are built on first access.
+# The definitions are read from the tool sources, and a tool module is imported only when one of its tools is used.
 
-for module_name in INSTALLED_TOOLS:
-    # Import the module
-    module = importlib.import_module(f"oa.tools.{module_name}")
 
-    # Get all classes in the module
-    classes = inspect.getmembers(module, inspect.isclass)
+class ToolImplementations(Mapping):
+    """
+    Maps the tool names to their classes, importing the module of a tool on first access
+    """
 
-    for class_name, cls in classes:
-        # Ensure the class is defined in the current module (not imported)
-        if cls.__module__ == module.__name__:
-            # Check if the class has a `definition` method
-            if hasattr(cls, 'definition') and callable(getattr(cls, 'definition')):
-                # Call the method directly without initializing, as it's a class method
-                definition = cls.definition()
+    def __init__(self, modules):
+        self.modules = modules  # tool name -> module name
 
-                # Add the definition output to FUNCTION_DEFINITIONS
-                FUNCTION_DEFINITIONS.append(definition)
+    def __getitem__(self, name):
+        module = importlib.import_module(f"oa.tools.{self.modules[name]}")
+        return getattr(module, name)
 
-                # Map function name to the class itself
-                FUNCTION_IMPLEMENTATIONS[definition['name']] = cls
+    def __iter__(self):
+        return iter(self.modules)
+
+    def __len__(self):
+        return len(self.modules)
+
+
+@cache
+def get_definitions():
+    return load_definitions(INSTALLED_TOOLS, TOOL_DEFINITIONS_CACHE)
+
+
+def __getattr__(name):
+    if name == 'FUNCTION_DEFINITIONS':
+        return [definition for _, definition in get_definitions()]
+    if name == 'FUNCTION_IMPLEMENTATIONS':
+        return ToolImplementations({definition['name']: module_name for module_name, definition in get_definitions()})
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+
+class PageCache:
+    """
+    On-disk cache of the pages fetched by the web tools.
+
+    Entries hold the text already extracted from the page along with the validators of the response
+    (ETag, Last-Modified), so that a fresh entry costs nothing and a stale one costs a conditional request.
+    Entries are kept per namespace (e.g. the tool), as the text extracted from the same URL differs between tools.
+    The least recently used entries are removed when the cache grows over `max_bytes`.
+    The size of the cache is listed once and then tracked as entries are stored, so that the directory is only
+    listed again when it goes over `max_bytes`; eviction then brings it down to `low_water` of `max_bytes`.
+    """
+    low_water = 0.9
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._size = None  # Total size of the entries, as far as this process knows
+
+    def get(self, url, namespace=''):
+        path = self._get_path(url, namespace)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+            os.utime(path)  # Marks the entry as recently used
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+
+        if entry.get('url') != url or entry.get('namespace', '') != namespace:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return entry
+
+    def set(self, url, text, headers, namespace=''):
+        """Stores the text extracted from the response, unless the response forbids it."""
+        expires = get_expiry(headers)
+        if expires is False:
+            return
+
+        entry = {
+            'url': url,
+            'namespace': namespace,
+            'text': text,
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'expires': expires,
+        }
+        if expires is None and not entry['etag'] and not entry['last_modified']:
+            # Could neither be reused nor revalidated
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._get_path(url, namespace)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(entry, f)
+            size = f.tell()
+        os.replace(temp_path, path)
+
+        with self._lock:
+            if self._size is not None:
+                self._size += size
+            if self._size is not None and self._size <= self.max_bytes:
+                return
+        self.evict()
+
+    def evict(self):
+        with self._lock:
+            try:
+                entries = [e for e in os.scandir(self.directory) if e.name.endswith('.json')]
+            except OSError:
+                return
+            stats = [(e.stat().st_mtime, e.stat().st_size, e.path) for e in entries]
+            total = sum(size for _, size, _ in stats)
+            if total > self.max_bytes:
+                for _, size, path in sorted(stats):
+                    if total <= self.max_bytes * self.low_water:
+                        break
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                    total -= size
+            self._size = total
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / total if total else 0.0,
+        }
+
+    def _get_path(self, url, namespace=''):
+        key = f"{namespace}:{url}"
+        return os.path.join(self.directory, f"{hashlib.sha256(key.encode()).hexdigest()}.json")
+
+
+def get_expiry(headers):
+    """
+    Returns the time until which a response can be used without revalidation,
+    None if it always needs revalidation, or False if it must not be stored.
+    """
+    directives = {}
+    for directive in headers.get('Cache-Control', '').split(','):
+        name, _, value = directive.strip().partition('=')
+        directives[name.lower()] = value.strip('"')
+
+    if 'no-store' in directives or 'private' in directives:
+        return False
+    if 'no-cache' in directives:
+        return None
+    if 'max-age' in directives:
+        try:
+            return time.time() + int(directives['max-age'])
+        except ValueError:
+            return None
+    if expires := headers.get('Expires'):
+        try:
+            return parsedate_to_datetime(expires).timestamp()
+        except (TypeError, ValueError):
+            return None
+    return None
+
+
+def is_fresh(entry):
+    return entry['expires'] is not None and entry['expires'] > time.time()
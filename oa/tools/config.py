@@ -1,5 +1,22 @@
+import os
+import tempfile
 
 INSTALLED_TOOLS = [
 #    "core",
     "web",
 ]
+
+# The tool definitions are generated from the sources and persisted here until the sources change
+TOOL_DEFINITIONS_CACHE = os.getenv(
+    'TOOL_DEFINITIONS_CACHE', os.path.join(tempfile.gettempdir(), 'oa-tool-definitions.json')
+)
+
+
+# Web tools
+WEB_TIMEOUT = 10  # seconds
+WEB_MAX_BYTES = 2 * 1024 * 1024  # responses are cut beyond this size
+WEB_PAGE_MAX_TOKENS = 8000  # page contents returned to the assistant are cut beyond this size
+
+# Fetched pages are cached on disk with their extracted text
+WEB_CACHE_DIR = os.getenv('WEB_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'oa-web-cache'))
+WEB_CACHE_MAX_BYTES = int(os.getenv('WEB_CACHE_MAX_BYTES', 100 * 1024 * 1024))
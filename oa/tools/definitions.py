@@ -0,0 +1,145 @@
+import ast
+import hashlib
+import importlib.util
+import json
+import logging
+import os
+import docstring_parser
+
+
+logger = logging.getLogger(__name__)
+
+
+def build_definition(name, description, init_docstring, parameters):
+    """
+    Generate a JSON description of a tool in the format expected by the assistant
+
+    :param parameters: (name, type name, required) of the parameters of the tool's __init__ method
+    """
+    # Parse the docstring of __init__ to get parameter descriptions
+    param_descriptions = {}
+    if init_docstring:
+        parsed_docstring = docstring_parser.parse(init_docstring)
+        param_descriptions = {param.arg_name: param.description for param in parsed_docstring.params}
+
+    json_description = {
+        "name": name,
+        "description": description,
+        "parameters": {
+            "type": "object",
+            "properties": {},
+            "required": []
+        }
+    }
+
+    for param_name, param_type, required in parameters:
+        json_description["parameters"]["properties"][param_name] = {
+            "type": param_type,
+            "description": param_descriptions.get(param_name, "")
+        }
+        if required:
+            json_description["parameters"]["required"].append(param_name)
+
+    return json_description
+
+
+def get_source_definitions(source):
+    """
+    Generate the definitions of the tools in the module source without importing it,
+    so that the dependencies of the tools are only loaded when they are executed.
+    """
+    definitions = []
+    # Tool base classes -> (__init__ docstring, parameters) inherited by their subclasses
+    tool_bases = {'AssistantTool': (None, [])}
+
+    for node in ast.parse(source).body:
+        if not isinstance(node, ast.ClassDef):
+            continue
+        base_names = {base.id if isinstance(base, ast.Name) else getattr(base, 'attr', None) for base in node.bases}
+        parent = next((name for name in base_names if name in tool_bases), None)
+        if parent is None:
+            continue
+
+        init_docstring, parameters = tool_bases[parent]
+        init_method = next(
+            (item for item in node.body if isinstance(item, ast.FunctionDef) and item.name == '__init__'), None
+        )
+        if init_method:
+            init_docstring = ast.get_docstring(init_method)
+            parameters = get_parameters(init_method.args)
+        # Subclasses of the tools defined in the module are tools too
+        tool_bases[node.name] = (init_docstring, parameters)
+
+        definitions.append(build_definition(node.name, ast.get_docstring(node), init_docstring, parameters))
+
+    return definitions
+
+
+def get_parameters(args):
+    positional = args.posonlyargs + args.args
+    # Defaults belong to the last positional parameters
+    required = [True] * (len(positional) - len(args.defaults)) + [False] * len(args.defaults)
+    parameters = [
+        (arg.arg, get_type_name(arg.annotation), is_required) for arg, is_required in zip(positional, required)
+    ]
+    parameters += [
+        (arg.arg, get_type_name(arg.annotation), default is None)
+        for arg, default in zip(args.kwonlyargs, args.kw_defaults)
+    ]
+    return [parameter for parameter in parameters if parameter[0] != 'self']
+
+
+def get_type_name(annotation):
+    if annotation is None:
+        return "string"
+    if isinstance(annotation, ast.Name):
+        return annotation.id
+    if isinstance(annotation, ast.Constant) and isinstance(annotation.value, str):
+        return annotation.value
+    return ast.unparse(annotation)
+
+
+def load_definitions(module_names, cache_path=None):
+    """
+    Returns (module name, definition) pairs for the tools in the modules.
+    The definitions are persisted as JSON in `cache_path` and regenerated only for the modules whose source changed,
+    or when this module changed, as it sets the format of the definitions.
+    """
+    with open(__file__, 'rb') as f:
+        generator_hash = hashlib.sha256(f.read()).digest()
+
+    cached = {}
+    if cache_path:
+        try:
+            with open(cache_path) as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    entries, changed = {}, False
+    for module_name in module_names:
+        spec = importlib.util.find_spec(f"oa.tools.{module_name}")
+        with open(spec.origin, 'rb') as f:
+            source = f.read()
+        source_hash = hashlib.sha256(generator_hash + source).hexdigest()
+
+        entry = cached.get(module_name)
+        if not entry or entry.get('hash') != source_hash:
+            entry = {'hash': source_hash, 'definitions': get_source_definitions(source)}
+            changed = True
+        entries[module_name] = entry
+
+    if cache_path and changed:
+        try:
+            temp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(temp_path, 'w') as f:
+                json.dump(entries, f)
+            os.replace(temp_path, cache_path)
+        except OSError as e:
+            logger.warning(f"Could not persist the tool definitions: {e}")
+
+    return [
+        (module_name, definition)
+        for module_name, entry in entries.items()
+        for definition in entry['definitions']
+    ]
@@ -0,0 +1,97 @@
+import re
+from html.parser import HTMLParser
+
+
+# Rough number of characters per token, used to turn a token budget into a text length
+CHARS_PER_TOKEN = 4
+
+
+class TextExtractor(HTMLParser):
+    """
+    Collects the text of an HTML document in a single pass, emitting every text node once.
+    Links are kept in Markdown format and the output stops at `max_chars`.
+    """
+    skipped_tags = {'script', 'style', 'nav', 'footer', 'header', 'aside', 'noscript', 'template', 'svg'}
+    block_tags = {
+        'p', 'div', 'li', 'ul', 'ol', 'br', 'hr', 'tr', 'table', 'section', 'article', 'main', 'blockquote', 'pre',
+        'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'dt', 'dd', 'figcaption',
+    }
+
+    def __init__(self, max_chars=None):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.parts = []
+        self.length = 0
+        self.truncated = False
+        self._skip_depth = 0
+        self._link_href = None
+        self._link_text = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.skipped_tags:
+            self._skip_depth += 1
+        elif self._skip_depth:
+            return
+        elif tag == 'a':
+            self._link_href = dict(attrs).get('href')
+            self._link_text = []
+        elif tag in self.block_tags:
+            self._emit('\n')
+
+    def handle_endtag(self, tag):
+        if tag in self.skipped_tags:
+            self._skip_depth = max(self._skip_depth - 1, 0)
+        elif self._skip_depth:
+            return
+        elif tag == 'a' and self._link_href is not None:
+            text = ' '.join(self._link_text).strip()
+            if text:
+                self._emit(f"[{text}]({self._link_href}) ")
+            self._link_href = None
+        elif tag in self.block_tags:
+            self._emit('\n')
+
+    def handle_data(self, data):
+        if self._skip_depth:
+            return
+        text = ' '.join(data.split())
+        if not text:
+            return
+        if self._link_href is not None:
+            self._link_text.append(text)
+        else:
+            self._emit(text + ' ')
+
+    def _emit(self, text):
+        if self.truncated:
+            return
+        if self.max_chars is not None and self.length + len(text) > self.max_chars:
+            text = text[:self.max_chars - self.length]
+            self.truncated = True
+        self.parts.append(text)
+        self.length += len(text)
+
+    def get_text(self):
+        text = ''.join(self.parts)
+        # Drop the trailing spaces and the empty lines left by the nested blocks
+        text = re.sub(r' *\n\s*', '\n', text)
+        return text.strip()
+
+
+def extract_text(html, max_tokens=None, chunk_size=64 * 1024):
+    """
+    Returns the text of the HTML document, cut to about `max_tokens` tokens.
+    The document is fed to the parser in chunks, and parsing stops as soon as the budget is used up.
+    """
+    extractor = TextExtractor(max_chars=max_tokens * CHARS_PER_TOKEN if max_tokens else None)
+    for start in range(0, len(html), chunk_size):
+        extractor.feed(html[start:start + chunk_size])
+        if extractor.truncated:
+            break
+    else:
+        extractor.close()
+
+    text = extractor.get_text()
+    if extractor.truncated:
+        text += '\n\n[The rest of the page is cut.]'
+    return text
@@ -0,0 +1,213 @@
+import hashlib
+import importlib.util
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from django.test import SimpleTestCase
+from . import web
+from .cache import PageCache
+from .definitions import load_definitions
+from .extract import CHARS_PER_TOKEN, extract_text
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        if self.path == '/fresh':
+            self.respond(200, b'<p>fresh</p>', {'Cache-Control': 'max-age=60'})
+        elif self.path == '/etag':
+            if self.headers.get('If-None-Match') == '"v1"':
+                self.respond(304, b'', {'ETag': '"v1"'})
+            else:
+                self.respond(200, b'<p>tagged</p>', {'ETag': '"v1"', 'Cache-Control': 'no-cache'})
+        else:
+            self.respond(404, b'', {})
+
+    def respond(self, status, body, headers):
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if status != 304:
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FetchTextTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), PageHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_port}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        PageHandler.requests = []
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.page_cache = PageCache(self.directory, max_bytes=1024 * 1024)
+        patcher = mock.patch.object(web, 'page_cache', self.page_cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.extracted = []
+
+    def extract(self, response, content):
+        self.extracted.append(content)
+        return content.decode()
+
+    async def test_fresh_entry_is_served_without_a_request(self):
+        url = f"{self.base_url}/fresh"
+        self.assertEqual(await web.fetch_text(url, self.extract, 'reader'), '<p>fresh</p>')
+        self.assertEqual(await web.fetch_text(url, self.extract, 'reader'), '<p>fresh</p>')
+        self.assertEqual(PageHandler.requests, ['/fresh'])
+        self.assertEqual(len(self.extracted), 1)
+
+    async def test_stale_entry_is_revalidated(self):
+        url = f"{self.base_url}/etag"
+        self.assertEqual(await web.fetch_text(url, self.extract, 'reader'), '<p>tagged</p>')
+        self.assertEqual(await web.fetch_text(url, self.extract, 'reader'), '<p>tagged</p>')
+        # The second request got a 304, so the page wasn't extracted again
+        self.assertEqual(PageHandler.requests, ['/etag', '/etag'])
+        self.assertEqual(len(self.extracted), 1)
+
+    async def test_namespaces_are_cached_apart(self):
+        url = f"{self.base_url}/fresh"
+        await web.fetch_text(url, self.extract, 'reader')
+        self.assertEqual(await web.fetch_text(url, lambda response, content: 'feed', 'feed'), 'feed')
+        self.assertEqual(await web.fetch_text(url, self.extract, 'reader'), '<p>fresh</p>')
+        self.assertEqual(len(PageHandler.requests), 2)
+
+
+class PageCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        headers = {'Cache-Control': 'max-age=60'}
+        cache = PageCache(self.directory, max_bytes=1024 ** 2)
+        cache.set('https://example.com/a', 'a' * 400, headers)
+        entry_size = os.path.getsize(cache._get_path('https://example.com/a'))
+        # Room for two entries; their sizes vary by a few bytes with the expiry time
+        cache.max_bytes = entry_size * 2 + entry_size // 2
+
+        cache.set('https://example.com/b', 'b' * 400, headers)
+        os.utime(cache._get_path('https://example.com/a'), (0, 0))
+        cache.set('https://example.com/c', 'c' * 400, headers)
+
+        self.assertIsNone(cache.get('https://example.com/a'))
+        self.assertIsNotNone(cache.get('https://example.com/b'))
+        self.assertIsNotNone(cache.get('https://example.com/c'))
+
+    def test_directory_is_listed_only_when_the_cache_is_full(self):
+        headers = {'Cache-Control': 'max-age=60'}
+        cache = PageCache(self.directory, max_bytes=1024 ** 2)
+        with mock.patch.object(cache, 'evict', wraps=cache.evict) as evict:
+            for index in range(10):
+                cache.set(f"https://example.com/{index}", 'x' * 400, headers)
+            self.assertEqual(evict.call_count, 1)
+
+            cache.max_bytes = cache._size
+            cache.set('https://example.com/last', 'x' * 400, headers)
+            self.assertEqual(evict.call_count, 2)
+        self.assertLessEqual(cache._size, cache.max_bytes * cache.low_water)
+
+
+class LoadDefinitionsTests(SimpleTestCase):
+    def test_definitions_of_an_older_generator_are_regenerated(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        cache_path = os.path.join(directory, 'definitions.json')
+        with open(importlib.util.find_spec('oa.tools.web').origin, 'rb') as f:
+            source_hash = hashlib.sha256(f.read()).hexdigest()
+        with open(cache_path, 'w') as f:
+            json.dump({'web': {'hash': source_hash, 'definitions': [{'name': 'Outdated'}]}}, f)
+
+        names = [definition['name'] for _, definition in load_definitions(['web'], cache_path)]
+        self.assertEqual(names, ['FeedParser', 'WebPageReader', 'WebSearch'])
+
+
+def article_page(paragraphs=5000):
+    """A long article under deeply nested layout blocks, with scripts and navigation around it"""
+    nav = ''.join(f'<li><a href="/section/{index}">Section {index}</a></li>' for index in range(200))
+    body = ''.join(
+        f'<div class="row"><div class="col"><p>Paragraph {index} of the article, with '
+        f'<a href="https://example.com/ref/{index}">reference {index}</a> and some more words.</p></div></div>'
+        for index in range(paragraphs)
+    )
+    script = '<script>' + 'var data = "' + 'x' * 200_000 + '";</script>'
+    return f'<html><head>{script}</head><body><nav><ul>{nav}</ul></nav><main>{body}</main></body></html>'
+
+
+def listing_page(items=20000):
+    """A long listing of links in nested spans, as in search results or indexes"""
+    items = ''.join(
+        f'<li><span><span><a href="https://example.com/item/{index}">Item {index}</a></span></span>'
+        f'<span>Description of item {index}</span></li>'
+        for index in range(items)
+    )
+    return f'<html><body><header>Site header</header><ul>{items}</ul><footer>Site footer</footer></body></html>'
+
+
+def table_page(rows=10000):
+    """A large data table with styles"""
+    rows = ''.join(f'<tr><td>Row {index}</td><td>{index * 3}</td><td>{index % 7}</td></tr>' for index in range(rows))
+    style = '<style>' + 'td { padding: 1px; } ' * 5000 + '</style>'
+    return f'<html><head>{style}</head><body><table>{rows}</table></body></html>'
+
+
+class ExtractTextTests(SimpleTestCase):
+    """Runs the extraction over a corpus of large pages"""
+    pages = {'article': article_page(), 'listing': listing_page(), 'table': table_page()}
+
+    def test_text_is_cut_at_the_token_budget(self):
+        for name, html in self.pages.items():
+            with self.subTest(page=name):
+                text = extract_text(html, max_tokens=1000)
+                self.assertTrue(text.endswith('[The rest of the page is cut.]'))
+                self.assertLessEqual(len(text.removesuffix('[The rest of the page is cut.]')), 1000 * CHARS_PER_TOKEN)
+
+    def test_links_are_kept_and_skipped_blocks_are_left_out(self):
+        text = extract_text(self.pages['article'])
+        self.assertIn('[reference 42](https://example.com/ref/42)', text)
+        self.assertNotIn('var data', text)
+        self.assertNotIn('Section 1', text)
+        # Nested blocks don't repeat the text of their children
+        self.assertEqual(text.count('Paragraph 42 of'), 1)
+
+        text = extract_text(self.pages['listing'])
+        self.assertIn('[Item 19999](https://example.com/item/19999)', text)
+        self.assertNotIn('Site footer', text)
+
+    def test_extraction_time(self):
+        for name, html in self.pages.items():
+            with self.subTest(page=name, size=len(html)):
+                started_at = time.perf_counter()
+                extract_text(html)
+                full = time.perf_counter() - started_at
+
+                started_at = time.perf_counter()
+                extract_text(html, max_tokens=1000)
+                budgeted = time.perf_counter() - started_at
+
+                # From 0.4 to 0.9 s per MB here, depending on the markup density
+                self.assertLess(full, 2 * len(html) / 1024 ** 2 + .5)
+                # Parsing stops once the budget is used up
+                self.assertLess(budgeted, full / 4)
@@ -1,9 +1,70 @@
+import asyncio
+import httpx
 import requests
 from time import sleep
 from googlesearch import search
-from bs4 import BeautifulSoup
 import feedparser
+from ..function_calls.http import http_pool
 from .base import AssistantTool
+from .cache import PageCache, is_fresh
+from .config import WEB_TIMEOUT, WEB_MAX_BYTES, WEB_CACHE_DIR, WEB_CACHE_MAX_BYTES, WEB_PAGE_MAX_TOKENS
+from .extract import extract_text
+
+
+page_cache = PageCache(WEB_CACHE_DIR, WEB_CACHE_MAX_BYTES)
+
+
+async def fetch(url, headers=None, max_bytes=WEB_MAX_BYTES):
+    """
+    Streams the response from the pooled client of the host, stopping at max_bytes.
+    Returns the response and the content read.
+    """
+    client = http_pool.get_client(url)
+    async with client.stream('GET', url, headers=headers, timeout=WEB_TIMEOUT, follow_redirects=True) as response:
+        chunks, size = [], 0
+        async for chunk in response.aiter_bytes():
+            chunks.append(chunk[:max_bytes - size])
+            size += len(chunk)
+            if size >= max_bytes:
+                break
+    return response, b''.join(chunks)
+
+
+async def fetch_text(url, extract, namespace, headers=None):
+    """
+    Returns the text extracted from the page at the URL, going through the page cache.
+    A fresh cached entry is returned as is; a stale one is revalidated with a conditional request.
+    `extract` is called in a worker thread with the response and its content, only when the page has changed.
+    The cached texts are kept apart by `namespace`, which names the extraction.
+    """
+    headers = dict(headers or {})
+    entry = await asyncio.to_thread(page_cache.get, url, namespace)
+    if entry:
+        if is_fresh(entry):
+            return entry['text']
+        if entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+
+    response, content = await fetch(url, headers=headers)
+
+    cache_headers = response.headers
+    if response.status_code == 304 and entry:
+        text = entry['text']
+        # A 304 response may leave out the validators of the cached entry
+        cache_headers = httpx.Headers({
+            key: value for key, value in (('ETag', entry['etag']), ('Last-Modified', entry['last_modified'])) if value
+        })
+        cache_headers.update(response.headers)
+    elif response.status_code == 200:
+        text = await asyncio.to_thread(extract, response, content)
+    else:
+        return None
+
+    if text is not None:
+        await asyncio.to_thread(page_cache.set, url, text, cache_headers, namespace)
+    return text
 
 
 class FeedParser(AssistantTool):
@@ -18,8 +79,17 @@ class FeedParser(AssistantTool):
         self.feed_url = feed_url
 
     def main(self):
-        feed = feedparser.parse(self.feed_url)
+        return self.format(feedparser.parse(self.feed_url))
+
+    async def amain(self):
+        return await fetch_text(
+            self.feed_url,
+            lambda response, content: self.format(feedparser.parse(content)),
+            namespace=type(self).__name__,
+        )
 
+    @staticmethod
+    def format(feed):
         if not feed.entries:
             return
 
@@ -53,31 +123,28 @@ class WebPageReader(AssistantTool):
     def main(self):
         response = requests.get(self.url, headers=self.headers)
         if response.status_code == 200:
-            soup = BeautifulSoup(response.text, 'html.parser')
-            # Remove non-content elements
-            for tag in soup(['script', 'style', 'nav', 'footer', 'header', 'aside']):
-                tag.decompose()
-
-            def preserve_links(tag):
-                """Convert a tag's contents to string, preserving <a> links."""
-                if tag.name == 'a':
-                    return f"[{tag.get_text()}]({tag.get('href')})"
-                return tag.get_text()
-
-            # Collect all text, with links formatted
-            content = []
-            for element in soup.find_all(['p', 'li', 'div', 'span']):
-                content.append(preserve_links(element))
-
-            if content:
-                text = '\n'.join(content)
-                return (
-                    f"Below are the contents of the URL: {self.url}. "
-                    f"If you think it is required to extend your research, "
-                    f"you can request the contents of the relevant URLs mentioned in this page "
-                    f"by calling the WebPageReader again.\n\n"
-                    f"PAGE CONTENTS:\n\n{text}"
-                )
+            return self.extract(response.text)
+
+    async def amain(self):
+        # Parsing is CPU bound, so fetch_text runs it off the event loop
+        return await fetch_text(
+            self.url,
+            lambda response, content: self.extract(content.decode(response.encoding or 'utf-8', errors='replace')),
+            namespace=type(self).__name__,
+            headers=self.headers,
+        )
+
+    def extract(self, html):
+        text = extract_text(html, max_tokens=WEB_PAGE_MAX_TOKENS)
+
+        if text:
+            return (
+                f"Below are the contents of the URL: {self.url}. "
+                f"If you think it is required to extend your research, "
+                f"you can request the contents of the relevant URLs mentioned in this page "
+                f"by calling the WebPageReader again.\n\n"
+                f"PAGE CONTENTS:\n\n{text}"
+            )
 
 
 class WebSearch(AssistantTool):
@@ -92,17 +159,37 @@ class WebSearch(AssistantTool):
         """
         self.query = query
 
+    def search(self):
+        return list(search(self.query, num_results=100, advanced=True))  # Convert generator to list
+
     def main(self):
         try:
-            results = list(search(self.query, num_results=100, advanced=True))  # Convert generator to list
+            results = self.search()
         except (requests.HTTPError, requests.ReadTimeout):
             return "[Error: Too Many Requests]"
         retry = 1
         while not results and retry < self.max_retries:
             # May be rate limited; retry
             sleep(.5 * retry)
-            results = list(search(self.query, num_results=100, advanced=True))
+            results = self.search()
             retry += 1
+        return self.format(results)
+
+    async def amain(self):
+        # googlesearch is blocking, so the searches are run in a worker thread
+        try:
+            results = await asyncio.to_thread(self.search)
+        except (requests.HTTPError, requests.ReadTimeout):
+            return "[Error: Too Many Requests]"
+        retry = 1
+        while not results and retry < self.max_retries:
+            # May be rate limited; retry
+            await asyncio.sleep(.5 * retry)
+            results = await asyncio.to_thread(self.search)
+            retry += 1
+        return self.format(results)
+
+    def format(self, results):
         if results:
             results_markdown = (
                 f'Below are the list of items returned for your query: "{self.query}".\n'
@@ -112,4 +199,3 @@ class WebSearch(AssistantTool):
             for item in results:
                 results_markdown += f"### [{item.title}]({item.url})\n{item.description}\n\n"
             return results_markdown
-
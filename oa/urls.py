@@ -26,6 +26,7 @@ urlpatterns = [
 
     path('<uuid:project_uuid>/manage/', main_views.manage_overview, name='manage_overview'),
     path('<uuid:project_uuid>/analytics/', main_views.analytics, name='analytics'),
+    path('stats/', main_views.cache_stats, name='cache_stats'),
 
     path('<uuid:project_uuid>/chat/', main_views.thread_detail, name='thread_detail'),
 